@@ -0,0 +1,182 @@
+from random import Random
+import math
+import os
+import sys
+import tempfile
+import time
+
+from family_tree import Tree, Person, Relation, Gender, Family
+
+FIRST_NAMES = ('John', 'Mary', 'William', 'Elizabeth', 'James', 'Sarah', 'Thomas', 'Ann')
+SURNAMES = ('Smith', 'Brown', 'Wilson', 'Taylor', 'Johnson', 'White', 'Martin', 'Walker')
+
+
+def make_people(size: int, children: int=3, seed: int=0) -> list[Person]:
+    """Make a synthetic descendant tree of married couples with `size` people"""
+    rng = Random(seed)
+    people: list[Person] = []
+
+    def new(gender: Gender, family=()) -> Person:
+        person = Person(
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}',
+            gender=gender,
+            family=list(family),
+        )
+        people.append(person)
+        return person
+
+    def marry(husband: Person, wife: Person):
+        husband.family.append(Family(Relation.spouse, wife.id))
+        return husband, wife
+
+    couples = [marry(new(Gender.male), new(Gender.female))]
+    while couples and len(people) < size:
+        next_couples = []
+        for father, mother in couples:
+            for _ in range(rng.randint(1, children)):
+                if len(people) >= size:
+                    break
+                gender = rng.choice((Gender.male, Gender.female))
+                child = new(gender, (
+                    Family(Relation.father, father.id),
+                    Family(Relation.mother, mother.id),
+                ))
+                if len(people) >= size:
+                    break
+                if gender == Gender.male:
+                    next_couples.append(marry(child, new(Gender.female)))
+                else:
+                    next_couples.append(marry(new(Gender.male), child))
+        couples = next_couples
+
+    return people
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    rv = func(*args, **kwargs)
+    return rv, time.perf_counter() - start
+
+
+def bench_load(sizes: list[int]):
+    print(f'{"people":>8} {"load (s)":>10} {"extend (s)":>11} {"get (us)":>10} {"token (us)":>11}')
+    for size in sizes:
+        people = make_people(size)
+        tree, load = timed(Tree, people)
+        tree.set_head(people[-1])
+
+        _, extend = timed(Tree().extend, make_people(size))
+
+        ids = [p.id for p in people]
+        _, get = timed(lambda: [tree.get(i) for i in ids])
+        _, token = timed(lambda: [tree.search_token('john', 'smith') for _ in range(100)])
+
+        print(f'{size:>8} {load:>10.3f} {extend:>11.3f} {get / size * 1e6:>10.3f} {token / 100 * 1e6:>11.3f}')
+
+
+def bench_storage(sizes: list[int]):
+    print(f'{"people":>8} {"save (s)":>10} {"size (MB)":>10} {"open (ms)":>10} {"again (ms)":>11}')
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            people = make_people(size)
+            tree = Tree(people)
+            tree.set_head(people[-1])
+
+            path = os.path.join(folder, f'{size}.bft')
+            _, save = timed(tree.save, path)
+            # opened twice in this process, alongside the people it was saved from
+            def open_tree() -> Tree:
+                loaded = Tree.load(path)
+                loaded.head.parents
+                return loaded
+
+            opened = []
+            for _ in range(2):
+                loaded, load = timed(open_tree)
+                assert [p.id for p in loaded.head.parents] == [p.id for p in tree.head.parents]
+                opened.append(load * 1000)
+                loaded.close()
+
+            print(f'{size:>8} {save:>10.3f} {os.path.getsize(path) / 1e6:>10.1f} {opened[0]:>10.1f} {opened[1]:>11.1f}')
+
+
+def bench_gedcom(sizes: list[int]):
+    import gedcom
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            print(f'{size} people')
+            path = os.path.join(folder, f'{size}.ged')
+            gedcom.write(Tree(make_people(size)), path)
+            gedcom.read(path)
+
+
+def bench_layout(sizes: list[int]):
+    from layout import Layout, TidyLayout
+    print(f'{"people":>8} {"layout":>7} {"time (ms)":>10} {"width":>10} {"parent dx":>10}')
+    for size in sizes:
+        people = make_people(size)
+        tree = Tree(people)
+        tree.set_head([p for p in people if p.parents][-1])
+        relatives = tree.blood_relatives(size)
+        for name, kind in (('greedy', Layout), ('tidy', TidyLayout)):
+            positions, seconds = timed(lambda: kind(tree, relatives).run().positions())
+            xs = [x for x, _ in positions.values()]
+            # how far children are from their parents, shorter lines are easier to follow
+            dx = [
+                abs(positions[person][0] - positions[parent][0])
+                for person in positions
+                for parent in person.parents
+                if parent in positions
+            ]
+            print(f'{size:>8} {name:>7} {seconds * 1000:>10.1f} {max(xs) - min(xs):>10.0f} {sum(dx) / max(len(dx), 1):>10.0f}')
+
+
+def bench_untangle(sizes: list[int]):
+    from layout import Layout
+    print(f'{"people":>8} {"order":>7} {"before":>8} {"after":>8} {"sweeps":>7} {"time (ms)":>10} {"per ms":>8}')
+    for size in sizes:
+        people = make_people(size)
+        tree = Tree(people)
+        tree.set_head([p for p in people if p.parents][-1])
+        relatives = tree.blood_relatives(size)
+        for name, median in (('mean', False), ('median', True)):
+            untangled = Layout(tree, relatives).run().untangle(median=median)
+            print(
+                f'{size:>8} {name:>7} {untangled.crossings_before:>8} {untangled.crossings_after:>8} '
+                f'{untangled.sweeps:>7} {untangled.seconds * 1000:>10.1f} {untangled.per_ms:>8.1f}'
+            )
+
+
+def bench_branches(sizes: list[int]):
+    from layout import Layout
+    workers = os.cpu_count() or 1
+    print(f'{"people":>8} {"run (s)":>8} {"split (s)":>10} {f"{workers} workers (s)":>14}')
+    for size in sizes:
+        people = make_people(size)
+        tree = Tree(people)
+        tree.set_head([p for p in people if p.parents][-1])
+        relatives = tree.blood_relatives(size)
+        # run() is quadratic in the row length, so it's left out once it gets slow
+        _, whole = timed(Layout(tree, relatives).run) if size <= 20000 else (None, math.nan)
+        _, split = timed(Layout(tree, relatives).run_branches)
+        _, pooled = timed(Layout(tree, relatives).run_branches, workers)
+        print(f'{size:>8} {whole:>8.2f} {split:>10.2f} {pooled:>14.2f}')
+
+
+BENCHMARKS = {
+    'load': (bench_load, [1000, 4000, 16000, 64000]),
+    'storage': (bench_storage, [10000, 100000, 500000]),
+    'gedcom': (bench_gedcom, [10000, 100000]),
+    'layout': (bench_layout, [1000, 4000, 16000]),
+    'untangle': (bench_untangle, [1000, 4000, 16000]),
+    'branches': (bench_branches, [4000, 16000, 64000]),
+}
+
+
+if __name__ == '__main__':
+    names = [a for a in sys.argv[1:] if a in BENCHMARKS] or list(BENCHMARKS)
+    sizes = [int(a) for a in sys.argv[1:] if a.isdigit()]
+    for name in names:
+        bench, default_sizes = BENCHMARKS[name]
+        print(f'-- {name} --')
+        bench(sizes or default_sizes)
@@ -1,536 +1,482 @@
-from collections import defaultdict
-import re
-from typing import DefaultDict, Iterable, Literal, Sequence, Union
+from collections import OrderedDict, defaultdict
+from typing import DefaultDict, Union
+import numpy as np
 import pygame
-from pygame import sprite
-from family_tree import Tree, Person, Relation, Gender, Family
-from random import randrange
-from numbers import Number
-from PIL import Image
+from family_tree import Tree, Person
+from layout import Layout, TidyLayout
+from positions import GAP, Positions
+import render
+from render import WHITE
+from spatial import Box, Grid
 import time
-from math import ceil
-import sys
 
-pygame.init()
-font = pygame.font.Font(pygame.font.get_default_font(), 24)
-
-generations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
-# generations = 3
 screen_size = (1500, 900)
+# most frames drawn a second while something is moving, nothing is drawn while idle
+FPS = 60
+# the drawn tree is kept in tiles this big, at most MAX_TILES of them
+TILE_SIZE = 256
+MAX_TILES = 256
+# each wheel notch zooms by 2 ** (1 / ZOOM_STEPS), tiles are kept per level
+ZOOM_STEPS = 2
+MIN_ZOOM = -14
+MAX_ZOOM = 4
+# names are drawn down to this scale, below it people are dots
+LABEL_SCALE = 0.3
+DOT_RADIUS = 10
+# zoomed out, anyone whose descendants all fit in this many pixels is drawn as one box
+AGGREGATE_SIZE = 16
 
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-RED = (255, 0, 0)
-GRAY = (240, 240, 240)
-PERSON_COMPLETE = (200, 200, 200)
-PERSON_CHECK = (250, 250, 150)
-# \([0-9]+, [0-9]+, [0-9]+\)
-
-
-class Vector:
-    def __init__(self, point) -> None:
-        self.values = list(point)
-
-    def __iter__(self):
-        return iter(self.values)
-
-    def __getitem__(self, key):
-        return self.values[key]
-
-    def __setitem__(self, key, value):
-        self.values[key] = value
-
-    def __len__(self):
-        return len(self.values)
-
-    def __add__(self, other) -> 'Vector':
-
-        if isinstance(other, Number):
-            return Vector(
-                [v + other for v in self]
-            )
 
-        if isinstance(other, Iterable):
-            if len(self) != len(other):
-                raise ValueError('Vectors must be same size')
+def zoom(level: int) -> float:
+    return 2 ** (level / ZOOM_STEPS)
 
-            return Vector(
-                [x + y for x, y in zip(self, other)]
-            )
 
-    def __sub__(self, other) -> 'Vector':
+def dot_radius(scale: float) -> int:
+    return max(1, round(DOT_RADIUS * scale))
 
-        if isinstance(other, Iterable):
-            if len(self) != len(other):
-                raise ValueError('Vectors must be same size')
 
-            return Vector(
-                [x - y for x, y in zip(self, other)]
-            )
+def _scaled(box: Box, scale: float) -> Box:
+    """Where a box in the tree lands when it's drawn `scale` times its size
 
-        elif isinstance(other, Number):
-            return Vector(
-                [v - other for v in self]
-            )
-
-    def __truediv__(self, other: Number):
-        return Vector(
-            [v / other for v in self]
-        )
-
-    def __str__(self) -> str:
-        return f'Vector({self.values})'
+    Fonts don't grow evenly, so at any other size there's room left for
+    labels a few pixels bigger than their full size box scaled.
+    """
+    x, y, width, height = box
+    pad = 0 if scale == 1 else render.FONT_SIZE * scale / 4
+    return x*scale - pad, y*scale - pad, width*scale + 2*pad, height*scale + 2*pad
 
 
 class Node(pygame.sprite.Sprite):
-    def __init__(self, person: Person, pos, offset):
+    def __init__(self, person: Person, positions: Positions):
         pygame.sprite.Sprite.__init__(self)
         self.person = person
 
         self.clicked = False
         self.click_offset = 0, 0
-        self.pos = Vector(pos)
+        # views of the person's slot, so moving the node moves it in the arrays
+        slot = positions.slot[person]
+        self.pos: np.ndarray = positions.xy[slot]
+        self.size: np.ndarray = positions.size[slot]
         self.redraw()
 
-        self.update(offset, None)
-
     def redraw(self):
-        # Create an image of the block, and fill it with a color.
-        # This could also be an image loaded from the disk.
-        self.text: pygame.Surface = font.render(
-            self.person.name, True, BLACK)
-        self.image = pygame.Surface(self.text.get_size())
-        self.image.fill(GRAY)
-
-        if self.person.name.endswith(' children'):
-            color = PERSON_COMPLETE
-        elif not self.person.child_complete:
-            color = PERSON_CHECK
-        elif self.person.double_check:
-            color = PERSON_CHECK
-        else:
-            color = PERSON_COMPLETE
-
-        pygame.draw.rect(
-            self.image,
-            color,
-            (5, 5, *self.image.get_size()),
-        )
-        self.image.blit(self.text, (0, 0))
+        # the image is only made when the node is first drawn, so people
+        # nobody scrolls to never have their names rendered
+        self._image: Union[None, pygame.Surface] = None
+        self.size[:] = render.node_size(self.person)
+
+    @property
+    def image(self) -> pygame.Surface:
+        if self._image is None:
+            self._image = render.node_image(self.person)
+        return self._image
+
+    def update(self, offset, mouse_pos, scale: float=1):
+        if self.clicked:
+            self.pos[:] = (
+                (mouse_pos[0] - offset[0]) / scale + self.click_offset[0],
+                (mouse_pos[1] - offset[1]) / scale + self.click_offset[1]
+            )
 
-        # Fetch the rectangle object that has the dimensions of the image
-        # Update the position of this object by setting the values of rect.x and rect.y
-        self.rect = self.image.get_rect()
+    def screen_rect(self, offset, scale: float=1) -> pygame.Rect:
+        """Where the node is on screen when the tree is drawn `scale` times its size"""
+        width, height = self.size.tolist()
+        rect = pygame.Rect(0, 0, width * scale, height * scale)
+        rect.center = self.pos[0] * scale + offset[0], self.pos[1] * scale + offset[1]
+        return rect
 
-    def update(self, offset, mouse_pos):
-        if self.clicked:
-            self.pos = Vector((
-                mouse_pos[0] - offset[0] + self.click_offset[0],
-                mouse_pos[1] - offset[1] + self.click_offset[1]
-            ))
-            # self.rect.center = mouse_pos
-        # else:
-        self.rect.center = self.pos[0] + offset[0], self.pos[1] + offset[1]
-
-    def click(self, mouse_pos):
+    def click(self, mouse_pos, offset, scale: float=1):
+        """Start dragging, the node should be one NodeIndex.at() found under the mouse"""
+        # in tree coordinates, so it holds at any zoom
         self.click_offset = (
-            self.rect.centerx - mouse_pos[0],
-            self.rect.centery - mouse_pos[1]
+            self.pos[0] - (mouse_pos[0] - offset[0]) / scale,
+            self.pos[1] - (mouse_pos[1] - offset[1]) / scale
         )
-        if self.rect.collidepoint(mouse_pos):
-            self.clicked = True
+        self.clicked = True
 
     def unclick(self):
         self.clicked = False
 
 
-def _draw(screen, offset: tuple[int, int], people: set[Person], nodeGroup):
-    screen.fill(WHITE)
-    # screen.blit(people[0].image, (0, 0))
+class NodeIndex:
+    """Buckets the nodes and lines by where they are in the tree, so only what's on screen gets drawn
+
+    Boxes and lines are kept in tree coordinates, so panning doesn't change them.
+    """
+    def __init__(self, people: dict[Person, None], sprites: dict[Person, Node]):
+        self.people = people
+        self.sprites = sprites
+        self.rebuild()
+
+    def rebuild(self):
+        """Index everyone again, for when everything has moved"""
+        self.nodes: Grid[Person] = Grid()
+        self.lines: Grid[tuple[Person, int]] = Grid()
+        self._lines: dict[Person, list[tuple]] = {}
+        # where each node was when it was last indexed
+        self._boxes: dict[Person, Box] = {}
+        # draw in the same order as the people
+        self.order = {person: i for i, person in enumerate(self.people)}
+        self._forget()
+        for person in self.people:
+            self._index_node(person)
+        for person in self.people:
+            self._index_lines(person)
+
+    def _forget(self):
+        # worked out when they're needed for zooming out, until anything moves
+        self._spans: dict[Person, Box] = {}
+        self._collapsed: DefaultDict[float, dict[Person, bool]] = defaultdict(dict)
+        self._inside: DefaultDict[float, dict[Person, bool]] = defaultdict(dict)
+
+    def _index_node(self, person: Person):
+        box = self._box(person)
+        self._boxes[person] = box
+        self.nodes.insert(person, box)
+
+    def _box(self, person: Person) -> Box:
+        sprite = self.sprites[person]
+        x, y = sprite.pos.tolist()
+        width, height = sprite.size.tolist()
+        # a pixel bigger, as the rect on screen gets rounded
+        return x - width/2 - 1, y - height/2 - 1, width + 2, height + 2
+
+    def _index_lines(self, person: Person):
+        for i in range(len(self._lines.pop(person, ()))):
+            self.lines.remove((person, i))
+        if person not in self.nodes:
+            return
 
-    for i in range(generations+1):
-        pygame.draw.rect(
-            screen,
-            GRAY,
-            (0, i*300+offset[1]+40, screen.get_width(), 40)
+        centers = {
+            p: tuple(self.sprites[p].pos.tolist())
+            for p in (person, *person.parents, *person.spouses)
+            if p in self.sprites
+        }
+        lines = list(render.lines_from(person, self.people, centers))
+        self._lines[person] = lines
+        for i, line in enumerate(lines):
+            self.lines.insert((person, i), self._line_box(line))
+
+    @staticmethod
+    def _line_box(line: tuple) -> Box:
+        _, (x0, y0), (x1, y1), width = line
+        return (
+            min(x0, x1) - width, min(y0, y1) - width,
+            abs(x1 - x0) + 2*width, abs(y1 - y0) + 2*width,
         )
 
-    # draw a black line from people to their parent(s)
+    def _relink(self, person: Person):
+        # lines from their children and spouses end at them too
+        for p in (person, *person.children, *person.spouses):
+            if p in self.nodes or p is person:
+                self._index_lines(p)
+
+    def area(self, person: Person) -> list[Box]:
+        """Someone's box and the lines that end at them, as they were last indexed"""
+        boxes = [self._boxes[person]] if person in self._boxes else []
+        for p in (person, *person.children, *person.spouses):
+            boxes.extend(self._line_box(line) for line in self._lines.get(p, ()))
+        return boxes
+
+    def move(self, person: Person) -> list[Box]:
+        """Update someone after they're moved or resized, giving back what needs drawing again"""
+        if person not in self.nodes:
+            return []
+        before = self.area(person)
+        self._index_node(person)
+        self._relink(person)
+        self._forget()
+        return before + self.area(person)
+
+    def hide(self, person: Person) -> list[Box]:
+        before = self.area(person)
+        self.nodes.remove(person)
+        self._boxes.pop(person, None)
+        self._relink(person)
+        self._forget()
+        return before + self.area(person)
+
+    def visible(self, box: Box) -> tuple[list[tuple], list[Person]]:
+        """The lines and people that might be inside a box, in the order to draw them"""
+        lines = [self._lines[p][i] for p, i in sorted(self.lines.query(box), key=lambda key: (self.order[key[0]], key[1]))]
+        return lines, sorted(self.nodes.query(box), key=self.order.__getitem__)
+
+    def span(self, person: Person) -> Box:
+        """The box around someone and all their descendants"""
+        if person not in self._spans:
+            left, top, width, height = self._boxes[person]
+            right, bottom = left + width, top + height
+            for child in person.children:
+                if child in self.nodes:
+                    x, y, w, h = self.span(child)
+                    left, top = min(left, x), min(top, y)
+                    right, bottom = max(right, x + w), max(bottom, y + h)
+            self._spans[person] = (left, top, right - left, bottom - top)
+        return self._spans[person]
+
+    def summary(self, box: Box, scale: float) -> tuple[list[tuple], list[Person], list[Box]]:
+        """Like visible(), for when the tree is zoomed out too far for names
+
+        People are dots, and anyone whose descendants would all fit in
+        AGGREGATE_SIZE pixels is drawn as one box covering them instead.
+        Only one of the dots or lines that land on the same pixels is kept.
+        """
+        collapsed = self._collapsed[scale]
+        inside = self._inside[scale]
+
+        def collapses(person: Person) -> bool:
+            if person not in collapsed:
+                left, top, width, height = self.span(person)
+                collapsed[person] = (
+                    max(width, height) * scale <= AGGREGATE_SIZE
+                    and any(child in self.nodes for child in person.children)
+                )
+            return collapsed[person]
+
+        def hidden(person: Person) -> bool:
+            # a span holds all the spans below it, so anyone under a
+            # collapsed subtree has a collapsed parent
+            if person not in inside:
+                inside[person] = any(parent in self.nodes and collapses(parent) for parent in person.parents)
+            return inside[person]
+
+        # subtree boxes reach past the person at the top of them
+        margin = AGGREGATE_SIZE / scale
+        left, top, width, height = box
+        near = self.nodes.query((left - margin, top - margin, width + 2*margin, height + 2*margin))
+
+        radius = dot_radius(scale)
+        dots: set[tuple[int, int]] = set()
+        people: list[Person] = []
+        subtrees: list[Box] = []
+        for person in sorted(near, key=self.order.__getitem__):
+            if hidden(person):
+                continue
+            if collapses(person):
+                subtrees.append(self.span(person))
+                continue
+            x, y = self.sprites[person].pos.tolist()
+            dot = (round(x * scale / radius), round(y * scale / radius))
+            if dot not in dots:
+                dots.add(dot)
+                people.append(person)
+
+        drawn: set[tuple] = set()
+        lines = []
+        for p, i in sorted(self.lines.query(box), key=lambda key: (self.order[key[0]], key[1])):
+            if hidden(p):
+                continue
+            color, (x0, y0), (x1, y1), _ = line = self._lines[p][i]
+            pixels = (color, round(x0 * scale), round(y0 * scale), round(x1 * scale), round(y1 * scale))
+            if pixels not in drawn:
+                drawn.add(pixels)
+                lines.append(line)
+        return lines, people, subtrees
+
+    def at(self, mouse, offset, scale: float=1) -> list[Person]:
+        """Who's under the mouse"""
+        # zoomed out, the dots can be bigger than the boxes squashed down
+        reach = dot_radius(scale) if scale < LABEL_SCALE else 0
+        x, y = (mouse[0] - offset[0]) / scale, (mouse[1] - offset[1]) / scale
+        near = (x - reach/scale, y - reach/scale, 2*reach/scale, 2*reach/scale)
+        found = []
+        for person in sorted(self.nodes.query(near), key=self.order.__getitem__):
+            rect = self.sprites[person].screen_rect(offset, scale)
+            if reach:
+                rect.inflate_ip(max(0, 2*reach + 1 - rect.width), max(0, 2*reach + 1 - rect.height))
+            if rect.collidepoint(mouse):
+                found.append(person)
+        return found
+
+
+def _paint(surface: pygame.Surface, offset: tuple[int, int], index: NodeIndex, generations: int, scale: float=1):
+    """Draw the bands, lines and people that land on a surface, `scale` times their size"""
+    surface.fill(WHITE)
+    render.draw_bands(surface, offset, generations+1, scale)
+
+    width, height = surface.get_size()
+    box = (-offset[0] / scale, -offset[1] / scale, width / scale, height / scale)
+    if scale >= LABEL_SCALE:
+        lines, people = index.visible(box)
+        subtrees = []
+    else:
+        lines, people, subtrees = index.summary(box, scale)
+
+    def at(x, y):
+        return x * scale + offset[0], y * scale + offset[1]
+
+    for color, start, end, line_width in lines:
+        render.draw_line(surface, color, at(*start), at(*end), max(1, round(line_width * scale)))
+    for x, y, w, h in subtrees:
+        pygame.draw.rect(surface, render.SUBTREE, (*at(x, y), max(1, w * scale), max(1, h * scale)))
+
+    if scale < LABEL_SCALE:
+        radius = dot_radius(scale)
+        for person in people:
+            pygame.draw.circle(surface, render.person_color(person), at(*index.sprites[person].pos), radius)
+        return
+
+    # full size images are kept on the nodes, the other sizes share the label cache
+    size = round(render.FONT_SIZE * scale)
+    blits = []
     for person in people:
-        allowed_parents = [p for p in person.parents if p in people]
-        if len(allowed_parents) == 1:
-            parent = allowed_parents[0]
-            pygame.draw.line(
-                screen, BLACK, person.sprite.rect.center, parent.sprite.rect.center)
-        elif len(allowed_parents) == 2:
-            parent0 = allowed_parents[0]
-            parent1 = allowed_parents[1]
-            new_pos = (Vector(parent0.sprite.rect.center) +
-                        Vector(parent1.sprite.rect.center))/2
-            pygame.draw.line(screen, BLACK,
-                                person.sprite.rect.center, new_pos)
-
-        for spouse in person.spouses:
-            if spouse in people:
-                pygame.draw.line(screen, RED, person.sprite.rect.center, spouse.sprite.rect.center, 3)
-
-    nodeGroup.draw(screen)
-
-    pygame.display.flip()
-
-
-def drawTree(tree: Tree):
-
-    offset: Vector = Vector(screen_size) / 2
-    drag_screen = None
-
-    people = tree.explore_blood(generations)
-    print(f'{len(people)=}')
+        sprite = index.sprites[person]
+        image = sprite.image if size == render.FONT_SIZE else render.node_image(person, size)
+        blits.append((image, image.get_rect(center=at(*sprite.pos))))
+    surface.blits(blits, False)
+
+
+class TileCache:
+    """The drawn tree cut into square tiles for each zoom level, so panning only blits them
+
+    Tiles are drawn when they're first needed and the least recently used
+    ones are dropped past `limit`. Anything that changes the tree has to
+    invalidate the tiles it touched.
+    """
+    def __init__(self, index: NodeIndex, generations: int, size: int=TILE_SIZE, limit: int=MAX_TILES):
+        self.index = index
+        self.generations = generations
+        self.size = size
+        self.limit = limit
+        self._tiles: OrderedDict[tuple[int, int, int], pygame.Surface] = OrderedDict()
+
+    def clear(self):
+        self._tiles.clear()
+
+    def _range(self, box: Box) -> tuple[range, range]:
+        x, y, width, height = box
+        return (
+            range(int(x // self.size), int((x + width) // self.size) + 1),
+            range(int(y // self.size), int((y + height) // self.size) + 1),
+        )
 
-    generation_rows: DefaultDict[list[Person]] = defaultdict(list)
-    # generation_rows: list[list[Person]] = [list() for i in range(generations+1)]
-    tree.head.g = 0
-    tree.head.pos = 0
-    smallest_g = 0
-    largest_g = 0
-    tree.head.seen_path = []
-    next_add = {tree.head}
-    seen = {tree.head.id}
-
-    generation_rows[0].append(tree.head)
-
-    def add_left(person: Person, new: Person, update_path: bool=True):
-        assert person.g == new.g
-        new.pos = person.pos
-        if update_path:
-            new.seen_path = person.seen_path + [person]
-        generation_rows[new.g].insert(person.pos, new)
-        for p in generation_rows[person.g][person.pos+1:]:
-            p.pos += 1
-
-    def add_right(person: Person, new: Person, update_path: bool=True):
-        assert person.g == new.g
-        new.pos = person.pos+1
-        if update_path:
-            new.seen_path = person.seen_path + [person]
-        generation_rows[new.g].insert(person.pos+1, new)
-        for p in generation_rows[person.g][person.pos+2:]:
-            p.pos += 1
-
-    def add_parent(person: Person, new: Person):
-        assert person.g + 1 == new.g
-        # if there's no people yet
-        if not len(generation_rows[new.g]):
-            new.pos = 0 
-            generation_rows[new.g].append(new)
+    def invalidate(self, boxes: list[Box]):
+        if not boxes:
             return
-
-        # if they have a spouse
-        for parent in person.parents:
-            if not hasattr(parent, 'pos'):
+        for level in {key[0] for key in self._tiles}:
+            scale = zoom(level)
+            if scale < LABEL_SCALE:
+                # moving anyone can change which subtrees are grouped
+                for key in [key for key in self._tiles if key[0] == level]:
+                    del self._tiles[key]
                 continue
+            for box in boxes:
+                xs, ys = self._range(_scaled(box, scale))
+                for tile_x in xs:
+                    for tile_y in ys:
+                        self._tiles.pop((level, tile_x, tile_y), None)
+
+    def tile(self, level: int, x: int, y: int) -> pygame.Surface:
+        key = (level, x, y)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        # drawn with a pixel to spare all round, as pygame loses the first
+        # row of a line clipped at the top edge
+        whole = pygame.Surface((self.size + 2, self.size + 2))
+        _paint(whole, (1 - x*self.size, 1 - y*self.size), self.index, self.generations, zoom(level))
+        tile = whole.subsurface((1, 1, self.size, self.size))
+        self._tiles[key] = tile
+        if len(self._tiles) > self.limit:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def draw(self, screen: pygame.Surface, offset: tuple[int, int], area: pygame.Rect, level: int=0):
+        xs, ys = self._range((area.x - offset[0], area.y - offset[1], area.width, area.height))
+        screen.blits([
+            (self.tile(level, x, y), (x*self.size + offset[0], y*self.size + offset[1]))
+            for x in xs
+            for y in ys
+        ], False)
+
+
+def _draw(screen, offset: tuple[int, int], tiles: TileCache, level: int, area: Union[None, pygame.Rect]=None):
+    """Draw the screen, or just `area` of it"""
+    if area is None:
+        area = screen.get_rect()
+    screen.set_clip(area)
+    tiles.draw(screen, offset, area, level)
+    screen.set_clip(None)
+
+    if area == screen.get_rect():
+        pygame.display.flip()
+    else:
+        pygame.display.update(area)
+
+
+def _dirty(boxes: list[Box], offset, screen, scale: float=1) -> Union[None, pygame.Rect]:
+    """The part of the screen covering some boxes in the tree"""
+    if not boxes:
+        return None
+    rects = [
+        # a pixel bigger, as they're rounded when they're drawn
+        pygame.Rect(x + offset[0] - 1, y + offset[1] - 1, width + 3, height + 3)
+        for x, y, width, height in (_scaled(box, scale) for box in boxes)
+    ]
+    area = rects[0].unionall(rects).clip(screen.get_rect())
+    return area if area.width and area.height else None
+
+
+def drawTree(tree: Tree, generations: int=5, fps: int=FPS, tidy: bool=False, untangle: bool=False, workers: Union[None, int]=None):
+    pygame.init()
+
+    offset = np.array(screen_size) / 2
+    drag_screen = None
+    level = 0
 
-            if new.gender == Gender.male:
-                add_left(parent, new, False)
-                return
-            else:
-                add_right(parent, new, False)
-                return
-
-        # if there's a person on their left
-        for p in generation_rows[person.g][person.pos::-1]:
-            value = None
-            for p2 in p.parents:
-                if hasattr(p2, 'pos'):
-                    if value is None or p2.pos > value.pos:
-                        value = p2
-            if value is not None:
-                add_right(value, new, False)
-                return
-
-        # if there's a person on their right
-        for p in generation_rows[person.g][person.pos+1:]:
-            value = None
-            for p2 in p.parents:
-                if hasattr(p2, 'pos'):
-                    if value is None or p2.pos < value.pos:
-                        value = p2
-            if value is not None:
-                add_left(value, new, False)
-                return
-
-    def get_child_row(person: Person, row: int, dir:Literal['left', 'right'], ignore=None) -> Union[None, Person]:
-        if not hasattr(person, 'g'):
-            return
-        # if person.blood and any(p.blood for p in person.spouses):
-        #     return
-        if person == ignore:
-            return
-        if not hasattr(person, 'pos'):
-            return
-        if person.g == row:
-            print('    gcr', row, '-> ', person.name)
-            return person
-        print('    gcr', row, person.name, f'(ignore {ignore if ignore is None else ignore.name})')
-        children: list[Person] = []
-        for child in person.children:
-            rv = get_child_row(child, row, dir)
-            if rv is not None:
-                children.append(rv)
-        if children:
-            # print('looking at children', [c.name for c in children])
-            if dir == 'left':
-                return min(children, key=lambda x: x.pos)
-            else:
-                return max(children, key=lambda x: x.pos)
-
-    def add_child(person: Person, new: Person):
-        assert person.g - 1 == new.g
-        print('\nadding child', new.name, 'from', person.name)
-        print('path', [p.name for p in new.seen_path])
-        # if there's no people yet
-        if not len(generation_rows[new.g]):
-            new.pos = 0
-            generation_rows[new.g].append(new)
-            return
-
-        # if person.pos > 0 and generation_rows[person.g][person.pos-1] in person.seen_path:
-        #     idx = person.seen_path.index(generation_rows[person.g][person.pos-1])
-        #     print('checking left', [p.name for p in person.seen_path])
-        #     if person.seen_path[idx-1].blood and any(p.blood for p in person.seen_path[idx-1].spouses):
-        #         if person.seen_path[idx].sex == Sex.female:
-        #             if person.seen_path[idx-1].sex == Sex.male:
-        #                 add_left(person.seen_path[idx-1], new, False)
-        #                 print('finished 0')
-        #                 return
-        # if person.pos < len(generation_rows[person.g]) - 1 and generation_rows[person.g][person.pos+1] in person.seen_path:
-        #     print('checking right', [p.name for p in person.seen_path])
-        #     idx = person.seen_path.index(generation_rows[person.g][person.pos+1])
-        #     if person.seen_path[idx-1].blood and any(p.blood for p in person.seen_path[idx-1].spouses):
-        #         if person.seen_path[idx].sex == Sex.male:
-        #             if person.seen_path[idx-1].sex == Sex.female:
-        #                 add_right(person.seen_path[idx-1], new, False)
-        #                 print('finished 1')
-        #                 return
-
-        # if child is on the left
-        for p in reversed(generation_rows[person.g][:person.pos]):
-            print('checking left person', p.name)
-            child = get_child_row(p, new.g, 'right')
-            if child is not None:
-                print('child of', p.name)
-
-                if child.blood and any(p.blood for p in child.spouses):
-                    # add_left(child, new, False)
-                    continue
-                else:
-                    add_right(child, new, False)
-                print('finished 2')
-                return
-        # if child is on the right
-        for p in generation_rows[person.g][person.pos+1:]:
-            print('checking left person', p.name)
-            child = get_child_row(p, new.g, 'left')
-            if child is not None:
-                print('child of', p.name)
-
-                if child.blood and any(p.blood for p in child.spouses):
-                    # add_right(child, new, False)
-                    continue
-                else:
-                    add_left(child, new, False)
-
-                print('finished 3')
-                return
+    # reuses the walk fix() already did when the tree was loaded
+    people = tree.blood_relatives(generations)
+    print(f'{len(people)=}')
 
-        # last = None
-        # for p1 in reversed(new.seen_path):
-        #     p1: Person
-        #     for p in p1.siblings:
-        #         p: Person = p
-        #         p: Person
-        #         if p.pos < p1.pos:
-        #             print('checking next person right', p.name)
-        #             child = get_child_row(p, new.g, 'right', last)
-        #             if child is not None:
-        #                 child_parent = [cp for cp in child.parents if hasattr(cp, 'pos')]
-        #                 new_parent = [cp for cp in new.parents if hasattr(cp, 'pos')]
-        #                 # check if the rightmost child of this person in the 
-        #                 #   chain is more left than the current persons parents
-        #                 print('check', child.name)
-        #                 if child_parent[0].pos < new_parent[0].pos:
-        #                     closest = None
-        #                     print('comparing right row', p.name)
-        #                     # if we're adding to the left of the blood related person we
-        #                     #   want to make sure there's no one on our right already left of it
-        #                     for p2 in generation_rows[person.g][person.pos+1:]:
-        #                         c2 = get_child_row(p2, new.g, 'left')
-        #                         print('blood checking left of', p2.name)
-        #                         if c2 is not None:
-        #                             print('furthest left is', c2.name)
-        #                             if c2.pos < child.pos:
-        #                                 add_left(c2, new, False)
-        #                                 print('finished 0 - 0')
-        #                                 return
-        #                             # break
-        #                     if child.blood and any(p.blood for p in child.spouses):
-        #                         add_left(child, new, False)
-        #                         print('left of', child.name)
-        #                     else:
-        #                         add_right(child, new, False)
-        #                         print('right of', child.name)
-        #                     print('finished 0')
-        #                     return
-        #         elif p.pos > p1.pos:
-        #             print('checking person left', p.name)
-        #             child = get_child_row(p, new.g, 'left', last)
-        #             if child is not None:
-        #                 child_parent = [cp for cp in child.parents if hasattr(cp, 'pos')]
-        #                 new_parent = [cp for cp in new.parents if hasattr(cp, 'pos')]
-        #                 # check if the leftmost child of this person in the 
-        #                 #   chain is more right than the current persons parents
-        #                 print('check', child.name)
-        #                 if child_parent[0].pos > new_parent[0].pos:
-        #                     print('comparing left row', p.name)
-        #                     # if we're adding to the right of the blood related person we
-        #                     # want to make sure there's no one on our left already right of it
-        #                     for p2 in reversed(generation_rows[person.g][:person.pos]):
-        #                         c2 = get_child_row(p2, new.g, 'right')
-        #                         print('blood checking right of', p2.name)
-        #                         if c2 is not None:
-        #                             print('furthest right is', c2.name)
-        #                             if c2.pos > child.pos:
-        #                                 add_right(c2, new, False)
-        #                                 print('finished 1 - 0')
-        #                                 return
-        #                             # break
-        #                     if child.blood and any(p.blood for p in child.spouses):
-        #                         add_right(child, new, False)
-        #                         print('right of', child.name)
-        #                     else:
-        #                         add_left(child, new, False)
-        #                         print('left of', child.name)
-        #                     print('finished 1')
-        #                     return
-        #     # child = get_child_row(p, new.g, 'left', last)
-        #     # if child is not None:
-        #     #     print('child of', p.name)
-        #     #     if child.blood and any(p.blood for p in child.spouses):
-        #     #         add_right(child, new, False)
-        #     #     else:
-        #     #         add_left(child, new, False)
-
-        #     #     print('finished 1')
-        #     #     return
-        #     last = p1
-        # assert False
-
-
-        for p in reversed(new.seen_path):
-            p: Person
-            print(p.name, p.g, '==', new.g, end=' ')
-            if p.g == new.g:
-                if p.gender == Gender.male:
-                    add_left(p, new, False)
-                    print('finished 4')
-                    return
-                else:
-                    add_right(p, new, False)
-                    print('finished 5')
-                    return
-
-
-    while next_add:
-        person = next_add.pop()
-        smallest_g = min(person.g, smallest_g)
-        largest_g = max(person.g, largest_g)
-        for sibling in person.siblings:
-            if sibling.id in seen:
-                continue
-            if sibling not in people:
-                continue
-            sibling.g = person.g
-            sibling.seen_path = person.seen_path + [person]
-            if person.gender == Gender.male:
-                add_left(person, sibling)
-            else:
-                add_right(person, sibling)
-                
-            assert hasattr(sibling, 'pos')
-            next_add.add(sibling)
-            seen.add(sibling.id)
-
-        for spouse in person.spouses:
-            if spouse.id in seen:
-                continue
-            if spouse not in people:
-                continue
-            spouse.g = person.g
-            spouse.seen_path = person.seen_path + [person]
-            if person.gender == Gender.male:
-                add_right(person, spouse)
-            else:
-                add_left(person, spouse)
-                
-            assert hasattr(spouse, 'pos')
-            seen.add(spouse.id)
-
-        for parent in person.parents:
-            if parent.id in seen:
-                continue
-            if parent not in people:
-                continue
-            parent.ignore_tree = True
-            parent.g = person.g + 1
-            parent.seen_path = person.seen_path + [person]
-            add_parent(person, parent)
+    if tidy:
+        layout = TidyLayout(tree, people, {person: render.node_size(person)[0] + GAP for person in people})
+    else:
+        layout = Layout(tree, people)
+    # with workers the branches off the head's line are laid out apart
+    start = time.perf_counter()
+    if workers is None:
+        layout.run()
+    else:
+        layout.run_branches(workers)
+    print(f'laid out in {time.perf_counter() - start:.2f}s')
+    if untangle and tidy:
+        # tidy positions don't follow the order of the rows, so it wouldn't change anything
+        print('untangle skipped, it has no effect on a tidy layout')
+    elif untangle:
+        untangled = layout.untangle()
+        print(
+            f'crossings {untangled.crossings_before} -> {untangled.crossings_after} '
+            f'in {untangled.seconds * 1000:.1f}ms, {untangled.per_ms:.1f}/ms'
+        )
+    generation_rows = layout.generation_rows()
+    smallest_g = layout.smallest_g
+    largest_g = layout.largest_g
+    generations_size = largest_g - smallest_g
+    positions = Positions(
+        {generation+smallest_g: generation_rows[generation+smallest_g] for generation in range(generations_size+1)},
+        layout.positions(),
+    )
 
-            assert hasattr(parent, 'pos')
-            next_add.add(parent)
-            seen.add(parent.id)
+    # kept in a dict, so it stays in order but checking and removing people is quick
+    people: dict[Person, None] = {}
+    sprites: dict[Person, Node] = {}
 
-        for child in person.children:
-            if child.id in seen:
-                continue
-            if child not in people:
-                continue
-            child.g = person.g - 1
-            child.seen_path = person.seen_path + [person]
-            add_child(person, child)
-
-            assert hasattr(child, 'pos')
-            next_add.add(child)
-            seen.add(child.id)
-
-    people: list[Person] = []
-        
-    person_width = 300
-    nodes = []
-    generations_size = largest_g - smallest_g
     for generation in range(generations_size+1):
         print('gen', generation)
         print([p.name for p in generation_rows[generation+smallest_g]], sep=', ')
-        for i, person in enumerate(generation_rows[generation+smallest_g]):
-            people.append(person)
-            person.sprite = Node(
-                person,
-                (
-                    (i - len(generation_rows[generation+smallest_g])/2)*person_width,
-                    # randrange(-3000, 3000),
-                    (generations_size - generation+smallest_g) * 300 + 60
-                ),
-                offset,
-            )
-            nodes.append(person.sprite)
+        for person in generation_rows[generation+smallest_g]:
+            people[person] = None
+            sprites[person] = Node(person, positions)
 
     print('total =', len(people))
 
     # for person in people:
     #     print(person.name)
-    #     generation = tree.head.generation(person)
-    #     path = tree.head.path(person)
+    #     generation = tree.relationship(tree.head, person).generation
+    #     path = tree.path(tree.head, person)
 
-    #     person.sprite = Node(
+    #     sprites[person] = Node(
     #         person,
     #         (
     #             sort_people(path) * 500,
@@ -539,123 +485,121 @@ def drawTree(tree: Tree):
     #         ),
     #         offset,
     #     )
-    #     nodes.append(person.sprite)
+    #     nodes.append(sprites[person])
     print('---done---')
     screen: pygame.Surface = pygame.display.set_mode(screen_size, pygame.RESIZABLE)
-    nodeGroup = pygame.sprite.Group(nodes)
-
-    repos = False
+    index = NodeIndex(people, sprites)
+    tiles = TileCache(index, generations)
+    dragging: list[Node] = []
+    clock = pygame.time.Clock()
+    # if the whole screen needs drawing, otherwise only what's moved is
+    redraw = True
+    drawn_offset = None
 
     while True:
-        mouse = Vector(pygame.mouse.get_pos())
+        mouse = np.array(pygame.mouse.get_pos())
         if drag_screen is not None:
             diff = mouse - drag_screen
             view_offset = offset + diff
         else:
             view_offset = offset
-
-        nodeGroup.update(view_offset, mouse)
-
-        _draw(screen, view_offset, people, nodeGroup)
-
-        for e in pygame.event.get():
+        scale = zoom(level)
+        if (tuple(view_offset), level) != drawn_offset:
+            redraw = True
+
+        moved = []
+        for n in dragging:
+            old = tuple(n.pos)
+            n.update(view_offset, mouse, scale)
+            if tuple(n.pos) != old:
+                moved.extend(index.move(n.person))
+        tiles.invalidate(moved)
+        if moved and scale < LABEL_SCALE:
+            redraw = True
+
+        if redraw:
+            _draw(screen, view_offset, tiles, level)
+        else:
+            area = _dirty(moved, view_offset, screen, scale)
+            if area is not None:
+                _draw(screen, view_offset, tiles, level, area)
+        redraw = False
+        drawn_offset = (tuple(view_offset), level)
+        clock.tick(fps)
+
+        # sleep until something happens, then handle everything that's waiting
+        for e in [pygame.event.wait(), *pygame.event.get()]:
             if e.type == pygame.MOUSEBUTTONDOWN:
                 if e.button == pygame.BUTTON_RIGHT:
                     drag_screen = mouse
                 elif e.button == pygame.BUTTON_LEFT:
-                    for n in nodeGroup:
-                        n.click(mouse)
+                    for person in index.at(mouse, view_offset, scale):
+                        sprites[person].click(mouse, view_offset, scale)
+                        dragging.append(sprites[person])
 
             elif e.type == pygame.MOUSEBUTTONUP:
                 if e.button == pygame.BUTTON_RIGHT and drag_screen is not None:
                     drag_screen = None
                     offset = view_offset
                 elif e.button == pygame.BUTTON_LEFT:
-                    for n in nodeGroup:
+                    for n in dragging:
                         n.unclick()
+                    dragging.clear()
+
+            elif e.type == pygame.MOUSEWHEEL:
+                new_level = min(MAX_ZOOM, max(MIN_ZOOM, level + e.y))
+                # keep the point under the mouse where it is
+                ratio = zoom(new_level) / scale
+                offset = offset + [round((m - v) * (1 - ratio)) for m, v in zip(mouse, view_offset)]
+                level = new_level
 
             elif e.type == pygame.QUIT:
                 pygame.quit()
                 return
+            elif e.type in (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                redraw = True
             elif e.type == pygame.KEYDOWN and e.key == pygame.K_h:
-                for person in tuple(people):
-                    if person.sprite.rect.collidepoint(mouse):
-                        nodeGroup.remove(person.sprite)
-                        people.remove(person)
-                        for generation in range(generations_size+1):
-                            generation_rows[generation+smallest_g].sort(key=lambda x:x.sprite.pos[0])
-                            if person in generation_rows[generation+smallest_g]:
-                                generation_rows[generation+smallest_g].remove(person)
+                redraw = True
+                for person in index.at(mouse, view_offset, scale):
+                    del people[person]
+                    tiles.invalidate(index.hide(person))
+                    positions.hide(person)
             elif e.type == pygame.KEYDOWN and e.key == pygame.K_g:
-                for person in tuple(people):
-                    if person.sprite.rect.collidepoint(mouse):
-                        any_children = False
-                        for sib in person.siblings:
-                            if sib.name.endswith(' children'):
-                                sib.name = str(int(sib.name.split()[0]) + 1) + ' children'
-                                any_children = True
-                                sib.sprite.redraw()
-                        if not any_children:
-                            person.name = '1 children'
-                            person.sprite.redraw()
-                            break
-                        nodeGroup.remove(person.sprite)
-                        people.remove(person)
-                        for generation in range(generations_size+1):
-                            generation_rows[generation+smallest_g].sort(key=lambda x:x.sprite.pos[0])
-                            if person in generation_rows[generation+smallest_g]:
-                                generation_rows[generation+smallest_g].remove(person)
+                redraw = True
+                for person in index.at(mouse, view_offset, scale):
+                    any_children = False
+                    for sib in person.siblings:
+                        if sib.name.endswith(' children'):
+                            tree.set_name(sib, str(int(sib.name.split()[0]) + 1) + ' children')
+                            any_children = True
+                            sprites[sib].redraw()
+                            tiles.invalidate(index.move(sib))
+                    if not any_children:
+                        tree.set_name(person, '1 children')
+                        sprites[person].redraw()
+                        tiles.invalidate(index.move(person))
+                        break
+                    del people[person]
+                    tiles.invalidate(index.hide(person))
+                    positions.hide(person)
             elif e.type == pygame.KEYDOWN and e.key == pygame.K_r:
-                for generation in range(generations_size+1):
-                    # sort all rows based on their new positions
-                    generation_rows[generation+smallest_g].sort(key=lambda x:x.sprite.pos[0])
-                    if pygame.key.get_mods() & pygame.KMOD_CTRL:
-                        for i, person in enumerate(generation_rows[generation+smallest_g]):
-                            old = person.sprite.pos[0]
-                            new = (i - len(generation_rows[generation+smallest_g]) / 2) * 300
-                            person.sprite.pos[0] = new
-                            person.sprite.rect.centerx += new - old
-                    for i, person in enumerate(generation_rows[generation+smallest_g]):
-                        person.sprite.pos[1] = (generations_size - generation+smallest_g) * 300 + 60
-                        if person.sprite.pos[0] > 0:
-                            if i > 0:
-                                diff = person.sprite.rect.left - generation_rows[generation+smallest_g][i-1].sprite.rect.right - 40
-                                if diff < 0 or pygame.key.get_mods() & pygame.KMOD_CTRL:
-                                    person.sprite.pos[0] -= diff
-                                    person.sprite.rect.x -= diff
-                    for i, person in reversed(tuple(enumerate(generation_rows[generation+smallest_g]))):
-                        person.sprite.pos[1] = (generations_size - generation+smallest_g) * 300 + 60
-                        if person.sprite.pos[0] < 0:
-                            if i < len(generation_rows[generation+smallest_g])-1:
-                                diff = generation_rows[generation+smallest_g][i+1].sprite.rect.left - person.sprite.rect.right - 40
-                                if diff < 0 or pygame.key.get_mods() & pygame.KMOD_CTRL:
-                                    person.sprite.pos[0] += diff
-                                    person.sprite.rect.x += diff
+                redraw = True
+                # ctrl squeezes the rows together, shift puts parents over their children
+                mods = pygame.key.get_mods()
+                positions.realign(
+                    {g: layout.row_y(g) for g in positions.rows},
+                    spread=bool(mods & pygame.KMOD_CTRL),
+                    center=bool(mods & pygame.KMOD_SHIFT),
+                )
+                index.rebuild()
+                tiles.clear()
             elif e.type == pygame.KEYDOWN and e.key == pygame.K_s:
-                rect = pygame.Rect(tree.head.sprite.rect)
-                for node in nodeGroup:
-                    rect.union_ip(node.rect)
-                print(*rect.topleft, *rect.size)
-                sub = screen.subsurface(screen.get_rect())
-                print(offset)
-                offset -= rect.topleft
-
-                from PIL import Image
-                im = Image.new(mode='RGB', size=rect.size)
-
-                for y in range(ceil(rect.height / screen.get_height())):
-                    for x in range(ceil(rect.width / screen.get_width())):
-                        view_offset = offset - (x * screen.get_width(), y * screen.get_height())
-                        # view_offset = offset - (x * 3, y * 3)
-                        nodeGroup.update(view_offset, mouse)
-                        # print(offset)
-                        _draw(screen, view_offset, people, nodeGroup)
-                        screenshot = pygame.image.tostring(sub, 'RGB')
-                        im.paste(Image.frombytes('RGB', screen.get_size(), screenshot), (x * screen.get_width(), y * screen.get_height()))
-                        # q = True
-                        time.sleep(0.1)
-                        pygame.event.get()
-
-                im.save('screenshot.png')
-                im.close()
+                start = time.perf_counter()
+                render.save_png(
+                    {person: tuple(sprites[person].pos.tolist()) for person in people},
+                    generations+1,
+                    'screenshot.png',
+                    progress=lambda done, total: print(f'{done}/{total} rows', end='\r'),
+                )
+                print(f'\nsaved in {time.perf_counter() - start:.2f}s')
 
@@ -1,7 +1,9 @@
-from dataclasses import dataclass, field
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from dataclasses import InitVar, dataclass, field
 from datetime import date
 from enum import Enum
-from typing import ClassVar, Union
+from typing import ClassVar, DefaultDict, Iterable, NamedTuple, Union
 import re
 
 re_fix_enum = re.compile(r'<([\w\.]+): [^>]+>')
@@ -43,28 +45,34 @@ class Relation(Enum):
     daughter = 12
 
     def is_parent(self):
-        return self in (
-            Relation.parent,
-            Relation.adopted_parent,
-            Relation.father,
-            Relation.mother,
-        )
+        return self in _PARENT_RELATIONS
 
     def is_child(self):
-        return self in (
-            Relation.child,
-            Relation.adopted_child,
-            Relation.son,
-            Relation.daughter,
-        )
+        return self in _CHILD_RELATIONS
 
     def is_spouse(self):
-        return self in (
-            Relation.spouse,
-            Relation.partner,
-        )
-
-@dataclass
+        return self in _SPOUSE_RELATIONS
+
+
+_PARENT_RELATIONS = frozenset((
+    Relation.parent,
+    Relation.adopted_parent,
+    Relation.father,
+    Relation.mother,
+))
+_CHILD_RELATIONS = frozenset((
+    Relation.child,
+    Relation.adopted_child,
+    Relation.son,
+    Relation.daughter,
+))
+_SPOUSE_RELATIONS = frozenset((
+    Relation.spouse,
+    Relation.partner,
+))
+
+
+@dataclass(slots=True)
 class Family:
     """What relation one person has to another"""
     relation: Relation
@@ -82,7 +90,7 @@ class Family:
         return f'Family({self.relation}, {self.person_id})'
 
 
-@dataclass
+@dataclass(slots=True)
 class Person:
     """A person as seen inside a family tree"""
     name: str
@@ -106,57 +114,29 @@ class Person:
     id: int = None
     curr_id: ClassVar[int] = 0
     seen_ids: ClassVar[set[int]] = set()
+    # people read from a tree file are unique within it, and the same file can be opened twice
+    check_id: InitVar[bool] = True
+
+    # built from family on demand, cleared by family_changed()
+    _parents: tuple['Person', ...] = field(default=None, init=False, repr=False, compare=False)
+    _children: tuple['Person', ...] = field(default=None, init=False, repr=False, compare=False)
+    _spouses: tuple['Person', ...] = field(default=None, init=False, repr=False, compare=False)
+    _siblings: tuple['Person', ...] = field(default=None, init=False, repr=False, compare=False)
+    _step_siblings: tuple['Person', ...] = field(default=None, init=False, repr=False, compare=False)
 
-    def __post_init__(self) -> None:
-        assert self.id not in Person.seen_ids
+    def __post_init__(self, check_id: bool) -> None:
+        assert not check_id or self.id not in Person.seen_ids
 
         if self.id is not None:
             Person.curr_id = max(self.id + 1, Person.curr_id)
         else:
             self.id = Person.curr_id
             Person.curr_id += 1
-        
-        Person.seen_ids.add(self.id)
-        assert 0 <= len(self.parents) <= 2
-
-    def generation(self, other: 'Person'):
-        level: set[tuple['Person', int]] = {(self, 0)}
-        next_level: set[tuple['Person', int]] = set()
-
-        while True:
-            for item in level:
-                if other == item[0]:
-                    return item[1]
-            for person in level:
-                for fam in person[0].parents:
-                    next_level.add((fam.person, person[1]+1))
-                for fam in person[0].children:
-                    next_level.add((fam.person, person[1]-1))
-            level = next_level
-            next_level = set()
-
-    def path(self, other: 'Person') -> tuple[Relation]:
-        level: set[tuple['Person', tuple]] = {(self, tuple())}
-        next_level: set[tuple['Person', tuple]] = set()
-
-        while True:
-            for item in level:
-                if other == item[0]:
-                    return item[1]
-            for person in level:
-                for fam in person[0].parents:
-                    if fam.person.sex == Sex.male:
-                        rel = Relation.father
-                    elif fam.person.sex == Sex.female:
-                        rel = Relation.mother
-                    else:
-                        rel = Relation.parent
-                    next_level.add((fam.person, person[1]+(rel,)))
-                for fam in person[0].children:
-                    next_level.add((fam.person, person[1]+(Relation.child,)))
-            level = next_level
-            next_level = set()
 
+        if check_id:
+            Person.seen_ids.add(self.id)
+        # don't use self.parents, the family links aren't filled in yet
+        assert 0 <= sum(f.relation.is_parent() for f in self.family) <= 2
 
     def __hash__(self) -> int:
         return self.id
@@ -175,36 +155,188 @@ class Person:
         return self.parent_complete and self.child_complete
 
     @property
-    def parents(self):
-        return [
-            f.person
-            for f in self.family
-            if f.relation.is_parent()
-        ]
+    def parents(self) -> tuple['Person', ...]:
+        if self._parents is None:
+            self._find_family()
+        return self._parents
+
+    @property
+    def children(self) -> tuple['Person', ...]:
+        if self._children is None:
+            self._find_family()
+        return self._children
 
     @property
-    def children(self):
-        return [
-            f.person
-            for f in self.family
-            if f.relation.is_child()
-        ]
+    def spouses(self) -> tuple['Person', ...]:
+        if self._spouses is None:
+            self._find_family()
+        return self._spouses
 
     @property
-    def spouses(self):
-        return [
-            f.person
-            for f in self.family
-            if f.relation.is_spouse()
-        ]
+    def siblings(self) -> tuple['Person', ...]:
+        if self._siblings is None:
+            self._find_siblings()
+        return self._siblings
 
     @property
-    def siblings(self):
-        return [
-            f.person
-            for f in self.family
-            if f.relation == Relation.sibling
-        ]
+    def step_siblings(self) -> tuple['Person', ...]:
+        if self._step_siblings is None:
+            self._find_siblings()
+        return self._step_siblings
+
+    def _find_family(self) -> None:
+        parents: list[Person] = []
+        children: list[Person] = []
+        spouses: list[Person] = []
+        for f in self.family:
+            if f.relation in _PARENT_RELATIONS:
+                parents.append(f.person)
+            elif f.relation in _CHILD_RELATIONS:
+                children.append(f.person)
+            elif f.relation in _SPOUSE_RELATIONS:
+                spouses.append(f.person)
+        self._parents = tuple(parents)
+        self._children = tuple(children)
+        self._spouses = tuple(spouses)
+
+    def _find_siblings(self) -> None:
+        """Group everyone under each of our parents by which parents we share"""
+        parent_ids = {f.person_id for f in self.family if f.relation in _PARENT_RELATIONS}
+        siblings: dict[Person, None] = {}
+        step_siblings: dict[Person, None] = {}
+        for parent in self.parents:
+            if parent is None:
+                continue
+            for child in parent.children:
+                if child is None or child == self or child in siblings or child in step_siblings:
+                    continue
+                child_parent_ids = {f.person_id for f in child.family if f.relation in _PARENT_RELATIONS}
+                if len(parent_ids & child_parent_ids) == 2:
+                    siblings[child] = None
+                else:
+                    step_siblings[child] = None
+
+        # siblings entered by hand, who we may not have parents for
+        for f in self.family:
+            if f.person is None or f.person in siblings or f.person in step_siblings:
+                continue
+            if f.relation == Relation.sibling:
+                siblings[f.person] = None
+            elif f.relation == Relation.step_sibling:
+                step_siblings[f.person] = None
+
+        self._siblings = tuple(siblings)
+        self._step_siblings = tuple(step_siblings)
+
+    def family_changed(self) -> None:
+        """Forget the cached relations, call this after editing `family`"""
+        self._parents = None
+        self._children = None
+        self._spouses = None
+        self._siblings = None
+        self._step_siblings = None
+
+
+def _name_tokens(name: str) -> set[str]:
+    return set(name.lower().split())
+
+
+class Blood(NamedTuple):
+    """How someone is blood related to the head of a tree"""
+    # generations above the head, negative for descendants
+    generation: int
+    # parent/child steps from the head
+    distance: int
+    # generations up to the nearest ancestor shared with the head
+    level: int
+
+
+@dataclass(slots=True)
+class Relationship:
+    """How one person is related to another"""
+    # generations the other person is above the first, None if they aren't connected
+    generation: Union[None, int]
+    # each parent/child step from the first person to the other
+    path: Union[None, tuple[Relation, ...]]
+    # the closest ancestors they share
+    common_ancestors: tuple[Person, ...]
+    # what the other person is to the first, e.g. "second cousin once removed"
+    label: str
+
+
+_DISTANCE_CACHE_SIZE = 8
+_ORDINALS = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth', 'ninth', 'tenth')
+_REMOVED = ('', ' once removed', ' twice removed', ' three times removed')
+
+
+def _gendered(person: Person, male: str, female: str, other: str) -> str:
+    if person.gender == Gender.male:
+        return male
+    if person.gender == Gender.female:
+        return female
+    return other
+
+
+def _ordinal(n: int) -> str:
+    if n <= len(_ORDINALS):
+        return _ORDINALS[n-1]
+    if n % 100 in (11, 12, 13):
+        return f'{n}th'
+    return f'{n}' + {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+
+
+def _kinship(other: Person, up: int, down: int, half: bool) -> str:
+    """Name what `other` is, when they are `down` generations below an ancestor who is `up` above us"""
+    if up == 0 and down == 0:
+        return 'self'
+    if up == 0:
+        base = _gendered(other, 'son', 'daughter', 'child')
+        if down == 1:
+            return base
+        return 'great-' * (down - 2) + 'grand' + base
+    if down == 0:
+        base = _gendered(other, 'father', 'mother', 'parent')
+        if up == 1:
+            return base
+        return 'great-' * (up - 2) + 'grand' + base
+
+    prefix = 'half-' if half else ''
+    if up == 1 and down == 1:
+        return prefix + _gendered(other, 'brother', 'sister', 'sibling')
+    if up == 1:
+        return 'great-' * (down - 2) + prefix + _gendered(other, 'nephew', 'niece', 'niece/nephew')
+    if down == 1:
+        return 'great-' * (up - 2) + prefix + _gendered(other, 'uncle', 'aunt', 'aunt/uncle')
+
+    removed = abs(up - down)
+    if removed < len(_REMOVED):
+        removed_text = _REMOVED[removed]
+    else:
+        removed_text = f' {removed} times removed'
+    return f'{prefix}{_ordinal(min(up, down) - 1)} cousin{removed_text}'
+
+
+def _step(person: Person, other: Person) -> Relation:
+    """The relation `other` has to `person`, who are a parent/child apart"""
+    if other in person.parents:
+        return {
+            Gender.male: Relation.father,
+            Gender.female: Relation.mother,
+        }.get(other.gender, Relation.parent)
+    return {
+        Gender.male: Relation.son,
+        Gender.female: Relation.daughter,
+    }.get(other.gender, Relation.child)
+
+
+def _lineage(node: Person):
+    """Everyone one parent/child step away"""
+    for person in node.parents:
+        if person is not None:
+            yield person
+    for person in node.children:
+        if person is not None:
+            yield person
 
 
 class Tree:
@@ -212,6 +344,30 @@ class Tree:
     def __init__(self, tree=None):
         self.tree: set[Person] = set() if tree is None else set(tree)
         self._head = None
+
+        # lookup indexes, kept in step with self.tree
+        self._by_id: dict[int, Person] = {}
+        self._by_token: DefaultDict[str, set[Person]] = defaultdict(set)
+        self._blood: set[Person] = set()
+        # generation relative to the head, built lazily as it depends on the head
+        self._by_generation: Union[None, dict[int, set[Person]]] = None
+        self._generation_keys: list[int] = []
+        # everyone blood related to the head, built lazily
+        self._relatives: Union[None, dict[Person, Blood]] = None
+        # the last few people asked about -> (distance, generation, previous) for everyone
+        self._distances: dict[Person, dict[Person, tuple[int, int, Person]]] = {}
+        self._ancestors: dict[Person, dict[Person, int]] = {}
+        # missing id -> people with a relation to it
+        self._pending: DefaultDict[int, set[Person]] = defaultdict(set)
+        # the head and their ancestors, built lazily
+        self._line: Union[None, set[Person]] = None
+        # a tree file people are read from as they're needed, see tree_file.py
+        self._source = None
+        # if everyone in the tree file has been read in
+        self._all_read = False
+
+        for node in self.tree:
+            self._index(node)
         self.connect()
         self.fix()
 
@@ -223,70 +379,194 @@ class Tree:
 
     def set_head(self, head: Person):
         self._head = head
+        self._changed()
+        self._line = None
+
+    def _changed(self) -> None:
+        """Forget anything worked out from the shape of the tree"""
+        self._by_generation = None
+        self._relatives = None
+        self._distances.clear()
+        self._ancestors.clear()
+
+    def _index(self, node: Person) -> None:
+        self._by_id[node.id] = node
+        for token in _name_tokens(node.name):
+            self._by_token[token].add(node)
+        if node.blood:
+            self._blood.add(node)
+
+    def _unindex(self, node: Person) -> None:
+        self._by_id.pop(node.id, None)
+        for token in _name_tokens(node.name):
+            self._by_token[token].discard(node)
+            if not self._by_token[token]:
+                del self._by_token[token]
+        self._blood.discard(node)
+
+    def _index_generations(self) -> None:
+        """Walk out from the head, giving everyone connected a generation (parents are +1)"""
+        by_generation: DefaultDict[int, set[Person]] = defaultdict(set)
+        if self.head is not None:
+            generation = {self.head: 0}
+            queue = deque([self.head])
+            while queue:
+                node = queue.popleft()
+                g = generation[node]
+                by_generation[g].add(node)
+                for rel, offset in (
+                    (node.parents, 1),
+                    (node.children, -1),
+                    (node.spouses, 0),
+                ):
+                    for person in rel:
+                        if person is not None and person not in generation:
+                            generation[person] = g + offset
+                            queue.append(person)
+        self._by_generation = dict(by_generation)
+        self._generation_keys = sorted(by_generation)
 
     def fix(self):
+        self.materialize()
+        self._changed()
         for node in self.tree:
-            for fam in node.family:
-                if fam.person is None:
-                    fam.person = self.get(fam.person_id)
-                if fam.relation == Relation.parent:
-                    if fam.person.gender == Gender.male:
-                        fam.relation = Relation.father
-                    elif fam.person.gender == Gender.female:
-                        fam.relation = Relation.mother
+            self._fix_node(node)
         for node in self.explore_blood():
             node.blood = True
+        self._blood = {node for node in self.tree if node.blood}
+        self._line = None
 
     def connect(self):
+        self.materialize()
         for node in self.tree:
-            for family in node.family:
-                rel = self.get(family.person_id)
-                # make sure parents and children are bidirectional
-                if family.relation.is_parent():
-                    if not any(f.person_id == node.id for f in rel.family):
-                        rel.family.append(
-                            Family(Relation.child, node.id)
-                        )
-                if family.relation == Relation.child:
-                    if not any(f.person_id == node.id for f in rel.family):
-                        rel.family.append(
-                            Family(Relation.parent, node.id)
-                        )
-                if family.relation == Relation.adopted_parent:
-                    if not any(f.person_id == node.id for f in rel.family):
-                        rel.family.append(
-                            Family(Relation.adopted_child, node.id)
-                        )
-                if family.relation == Relation.adopted_child:
-                    if not any(f.person_id == node.id for f in rel.family):
-                        rel.family.append(
-                            Family(Relation.adopted_parent, node.id)
-                        )
-                # make sure spouses are bidirectional
-                if family.relation.is_spouse():
-                    if not any(f.person_id == node.id for f in rel.family):
-                        rel.family.append(
-                            Family(Relation.spouse, node.id)
-                        )
-            # add sibling connector
-            for node2 in self.tree:
-                if node.id == node2.id:
+            self._connect_node(node)
+        for node in self.tree:
+            node.family_changed()
+        self._changed()
+
+    def _connect_node(self, node: Person) -> set[Person]:
+        """Make one node's relations bidirectional, returns everyone whose family changed"""
+        touched = {node}
+
+        # older saves have a sibling record from every time the tree was connected
+        sibling_ids: set[int] = set()
+        family_list: list[Family] = []
+        for family in node.family:
+            if family.relation in (Relation.sibling, Relation.step_sibling):
+                if family.person_id in sibling_ids:
                     continue
-                node_parents = [f.person_id for f in node.family if f.relation.is_parent()]
-                node2_parents = [f.person_id for f in node2.family if f.relation.is_parent()]
-
-                same = len([x for x in node_parents if x in node2_parents])
-                if same == 2:
-                    node.family.append(
-                        Family(Relation.sibling, node2.id)
+                sibling_ids.add(family.person_id)
+            family_list.append(family)
+        node.family[:] = family_list
+
+        for family in node.family:
+            rel = self.get(family.person_id)
+            if rel is None:
+                # connect them once they're added
+                self._pending[family.person_id].add(node)
+                continue
+            touched.add(rel)
+            # make sure parents and children are bidirectional
+            if family.relation.is_parent():
+                if not any(f.person_id == node.id for f in rel.family):
+                    rel.family.append(
+                        Family(Relation.child, node.id)
+                    )
+            if family.relation == Relation.child:
+                if not any(f.person_id == node.id for f in rel.family):
+                    rel.family.append(
+                        Family(Relation.parent, node.id)
                     )
-                elif same == 1:
-                    node.family.append(
-                        Family(Relation.step_sibling, node2.id)
+            if family.relation == Relation.adopted_parent:
+                if not any(f.person_id == node.id for f in rel.family):
+                    rel.family.append(
+                        Family(Relation.adopted_child, node.id)
                     )
+            if family.relation == Relation.adopted_child:
+                if not any(f.person_id == node.id for f in rel.family):
+                    rel.family.append(
+                        Family(Relation.adopted_parent, node.id)
+                    )
+            # make sure spouses are bidirectional
+            if family.relation.is_spouse():
+                if not any(f.person_id == node.id for f in rel.family):
+                    rel.family.append(
+                        Family(Relation.spouse, node.id)
+                    )
+        return touched
+
+    @staticmethod
+    def _reset_family_siblings(node: Person) -> None:
+        """Clear the sibling groups of a node and everyone sharing a parent with them"""
+        node.family_changed()
+        for parent in node.parents:
+            if parent is None:
+                continue
+            for child in parent.children:
+                if child is not None:
+                    child.family_changed()
+
+    def _fix_node(self, node: Person) -> None:
+        for fam in node.family:
+            if fam.person is None:
+                fam.person = self.get(fam.person_id)
+            if fam.relation == Relation.parent and fam.person is not None:
+                if fam.person.gender == Gender.male:
+                    fam.relation = Relation.father
+                elif fam.person.gender == Gender.female:
+                    fam.relation = Relation.mother
+        node.family_changed()
+
+    def _head_line(self) -> set[Person]:
+        """The head and all of their ancestors"""
+        if self._line is None:
+            self._line = set()
+            stack = [self.head] if self.head is not None else []
+            while stack:
+                node = stack.pop()
+                if node is None or node in self._line:
+                    continue
+                self._line.add(node)
+                self._mark_blood(node)
+                stack.extend(node.parents)
+        return self._line
+
+    def _mark_blood(self, node: Person) -> None:
+        """Mark a node and their descendants as blood"""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            # descendants of a blood node are already blood
+            if node is None or node in self._blood:
+                continue
+            node.blood = True
+            self._blood.add(node)
+            stack.extend(node.children)
+
+    def _update_blood(self, node: Person) -> None:
+        """Mark blood around someone whose relations just changed
+
+        Descendants of blood are always blood, so it only has to be pushed
+        down from whoever changed, and up the head's line when it grows.
+        """
+        line = self._head_line()
+        if node in line or any(child in line for child in node.children):
+            # parents they just gained are new ancestors of the head, and if
+            # they're not in the line yet they're one too, as are their ancestors
+            stack = list(node.parents) if node in line else [node]
+            while stack:
+                node = stack.pop()
+                if node is None or node in line:
+                    continue
+                line.add(node)
+                self._mark_blood(node)
+                stack.extend(node.parents)
+        elif any(parent is not None and parent.blood for parent in node.parents):
+            self._mark_blood(node)
 
     def search_names(self, name: str) -> set[Person]:
         """Get a list of people who have a partial match to a name"""
+        self.materialize()
         nodes: set[Person] = set()
 
         for node in self.tree:
@@ -295,6 +575,37 @@ class Tree:
 
         return nodes
 
+    def search_token(self, *tokens: str) -> set[Person]:
+        """Get the people whose name contains every one of the given words"""
+        if not tokens:
+            return set()
+        # the indexes only have people who've been read in
+        self.materialize()
+        matches = [self._by_token.get(t.lower(), set()) for t in tokens]
+        matches.sort(key=len)
+        return set(matches[0]).intersection(*matches[1:])
+
+    def generation(self, g: int) -> set[Person]:
+        """Get everyone `g` generations above the head (negative is below)"""
+        if self._by_generation is None:
+            self._index_generations()
+        return set(self._by_generation.get(g, ()))
+
+    def generations(self, low: int, high: int) -> dict[int, set[Person]]:
+        """Get everyone from generation `low` up to and including `high`"""
+        if self._by_generation is None:
+            self._index_generations()
+        keys = self._generation_keys
+        return {
+            g: set(self._by_generation[g])
+            for g in keys[bisect_left(keys, low):bisect_right(keys, high)]
+        }
+
+    def blood_people(self) -> set[Person]:
+        """Get everyone marked as blood related to the head"""
+        self.materialize()
+        return set(self._blood)
+
     def explore(self, levels: int) -> set[Person]:
         print('exploring', levels)
         if levels == 0:
@@ -319,67 +630,334 @@ class Tree:
         return seen
 
     def explore_blood(self, levels: Union[None, int]=None) -> set[Person]:
-        return self._explore_blood(levels)
-
-    def _explore_blood(self, levels: Union[None, int], _seen: set[Person]=None, _top: set[Person]=None) -> set[Person]:
-        if _seen is None or _top is None:
-            _seen = {self.head}
-            _top = {self.head}
-
-        if levels == 0:
-            return _seen
-
-        seen = set(_seen)
-        next_nodes: set[Person] = set()
-        next_top: set[Person] = set()
-
-        # get the next level of grandparents
-        for node in _top:
-            for parent in node.parents:
-                next_nodes.add(parent)
-                next_top.add(parent)
-
-        # add all descendents of grandparnts
-        while next_nodes:
-            node = next_nodes.pop()
-            seen.add(node)
-            for child in node.children:
-                next_nodes.add(child)
-
+        return set(self.blood_relatives(levels))
 
-        # recurse while there's still things to recurse
+    def blood_relatives(self, levels: Union[None, int]=None) -> dict[Person, 'Blood']:
+        """Get the head's ancestors up to `levels` generations up, and all their descendants"""
+        if self._relatives is None:
+            self._relatives = self._explore_blood()
         if levels is None:
-            if seen == _seen:
-                return seen
-            seen = self._explore_blood(levels, seen, next_top)
+            return dict(self._relatives)
+        return {
+            person: blood
+            for person, blood in self._relatives.items()
+            if blood.level <= levels
+        }
+
+    def _explore_blood(self) -> dict[Person, 'Blood']:
+        if self.head is None:
+            return {}
+
+        # go up a generation at a time, so everyone is found at their closest level
+        ancestors: dict[Person, int] = {self.head: 0}
+        frontier = [self.head]
+        level = 0
+        while frontier:
+            level += 1
+            next_frontier = []
+            for node in frontier:
+                for parent in node.parents:
+                    if parent is not None and parent not in ancestors:
+                        ancestors[parent] = level
+                        next_frontier.append(parent)
+            frontier = next_frontier
+
+        # then come down from every ancestor at once, nearest first, so
+        # everyone is reached through their closest ancestor
+        relatives: dict[Person, Blood] = {}
+        buckets: DefaultDict[int, list[tuple[Person, Blood]]] = defaultdict(list)
+        for node, level in ancestors.items():
+            buckets[level].append((node, Blood(level, level, level)))
+        distance = 0
+        while buckets:
+            for node, blood in buckets.pop(distance, ()):
+                if node in relatives:
+                    continue
+                relatives[node] = blood
+                for child in node.children:
+                    if child is not None and child not in relatives:
+                        buckets[distance + 1].append(
+                            (child, Blood(blood.generation - 1, distance + 1, blood.level))
+                        )
+            distance += 1
+        return relatives
+
+    def distances(self, head: Person=None) -> dict[Person, tuple[int, int, Person]]:
+        """Get the shortest parent/child path from `head` to everyone connected to them
+
+        Each person maps to (steps from head, generations above head, previous person on the path)
+        """
+        head = self.head if head is None else head
+        if head in self._distances:
+            # keep the most recently used at the end
+            self._distances[head] = self._distances.pop(head)
+            return self._distances[head]
+
+        distances = {head: (0, 0, None)}
+        queue = deque([head])
+        while queue:
+            node = queue.popleft()
+            distance, generation, _ = distances[node]
+            for person in node.parents:
+                if person is not None and person not in distances:
+                    distances[person] = (distance + 1, generation + 1, node)
+                    queue.append(person)
+            for person in node.children:
+                if person is not None and person not in distances:
+                    distances[person] = (distance + 1, generation - 1, node)
+                    queue.append(person)
+
+        self._distances[head] = distances
+        while len(self._distances) > _DISTANCE_CACHE_SIZE:
+            del self._distances[next(iter(self._distances))]
+        return distances
+
+    def _path_between(self, a: Person, b: Person) -> Union[None, list[Person]]:
+        """Shortest parent/child path from a to b, both included"""
+        if a in self._distances or b in self._distances:
+            start, end = (a, b) if a in self._distances else (b, a)
+            distances = self._distances[start]
+            if end not in distances:
+                return None
+            path = [end]
+            while path[-1] != start:
+                path.append(distances[path[-1]][2])
+            if start == a:
+                path.reverse()
+            return path
+
+        if a == b:
+            return [a]
+
+        # search from both ends, always growing the smaller side
+        origin = a
+        seen_a: dict[Person, tuple[int, Person]] = {a: (0, None)}
+        seen_b: dict[Person, tuple[int, Person]] = {b: (0, None)}
+        frontier_a = [a]
+        frontier_b = [b]
+        while frontier_a and frontier_b:
+            if len(frontier_a) > len(frontier_b):
+                frontier_a, frontier_b = frontier_b, frontier_a
+                seen_a, seen_b = seen_b, seen_a
+                a, b = b, a
+
+            next_frontier = []
+            meets = []
+            for node in frontier_a:
+                depth = seen_a[node][0] + 1
+                for person in _lineage(node):
+                    if person in seen_a:
+                        continue
+                    seen_a[person] = (depth, node)
+                    next_frontier.append(person)
+                    if person in seen_b:
+                        meets.append(person)
+            frontier_a = next_frontier
+
+            if meets:
+                # finish the level before picking, the first meeting might not be the shortest
+                meet = min(meets, key=lambda p: seen_b[p][0])
+                path = [meet]
+                while seen_a[path[-1]][1] is not None:
+                    path.append(seen_a[path[-1]][1])
+                path.reverse()
+                while seen_b[path[-1]][1] is not None:
+                    path.append(seen_b[path[-1]][1])
+                # the two sides may have swapped while searching
+                if path[0] != origin:
+                    path.reverse()
+                return path
+
+        return None
+
+    def path(self, a: Person, b: Person) -> Union[None, tuple[Relation, ...]]:
+        """Get each parent/child step on the shortest path from a to b"""
+        people = self._path_between(a, b)
+        if people is None:
+            return None
+        return tuple(_step(x, y) for x, y in zip(people, people[1:]))
+
+    def _ancestor_depths(self, person: Person) -> dict[Person, int]:
+        """Get a person and their ancestors, with how many generations up they are"""
+        if person in self._ancestors:
+            return self._ancestors[person]
+
+        depths = {person: 0}
+        frontier = [person]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for parent in node.parents:
+                    if parent is not None and parent not in depths:
+                        depths[parent] = depths[node] + 1
+                        next_frontier.append(parent)
+            frontier = next_frontier
+
+        self._ancestors[person] = depths
+        while len(self._ancestors) > _DISTANCE_CACHE_SIZE:
+            del self._ancestors[next(iter(self._ancestors))]
+        return depths
+
+    def relationship(self, a: Person, b: Person) -> Relationship:
+        """Work out how b is related to a"""
+        if a in self._distances or a == self.head:
+            distances = self.distances(a)
+            generation = distances[b][1] if b in distances else None
         else:
-            seen = self._explore_blood(levels-1, seen, next_top)
-
-        return seen
+            generation = None
+        path = self.path(a, b)
+        if path is not None and generation is None:
+            generation = sum(r.is_parent() for r in path) - sum(r.is_child() for r in path)
+
+        a_depths = self._ancestor_depths(a)
+        b_depths = self._ancestor_depths(b)
+        if len(b_depths) < len(a_depths):
+            common = [p for p in b_depths if p in a_depths]
+        else:
+            common = [p for p in a_depths if p in b_depths]
+
+        if not common:
+            if b in a.spouses:
+                label = _gendered(b, 'husband', 'wife', 'spouse')
+            elif path is not None:
+                label = 'related by marriage'
+            else:
+                label = 'not related'
+            return Relationship(generation, path, (), label)
+
+        closest = min(a_depths[p] + b_depths[p] for p in common)
+        ancestors = tuple(p for p in common if a_depths[p] + b_depths[p] == closest)
+        up = a_depths[ancestors[0]]
+        down = b_depths[ancestors[0]]
+
+        # half relations come through a single ancestor rather than a couple
+        half = False
+        if up and down:
+            a_side = next((c for c in ancestors[0].children if a_depths.get(c) == up - 1), None)
+            b_side = next((c for c in ancestors[0].children if b_depths.get(c) == down - 1), None)
+            if a_side is not None and b_side is not None:
+                half = set(a_side.parents) != set(b_side.parents)
+
+        return Relationship(generation, path, ancestors, _kinship(b, up, down, half))
+
+    def kinship(self, a: Person, b: Person) -> str:
+        """Name what b is to a, e.g. second cousin once removed"""
+        return self.relationship(a, b).label
 
     def add(self, node: Person) -> None:
-        self.tree.add(node)
-        self.connect()
-        self.fix()
+        self.extend((node,))
+
+    def extend(self, nodes: Iterable[Person]) -> None:
+        """Add people, only reconnecting the parts of the tree they touch"""
+        nodes = list(nodes)
+        for node in nodes:
+            if node in self.tree:
+                old = self.get(node.id)
+                self.tree.discard(old)
+                self._unindex(old)
+            self.tree.add(node)
+            self._index(node)
+
+        touched: set[Person] = set()
+        for node in nodes:
+            touched |= self._connect_node(node)
+            for other in self._pending.pop(node.id, ()):
+                touched |= self._connect_node(other)
+
+        for node in touched:
+            self._fix_node(node)
+        for node in touched:
+            self._reset_family_siblings(node)
+        # anyone whose relations were just filled in may be newly blood, not only the new people
+        for node in touched:
+            self._update_blood(node)
+        self._changed()
 
     def get(self, id: int) -> Person:
-        for node in self.tree:
-            if node.id == id:
-                return node
+        node = self._by_id.get(id)
+        if node is None and self._source is not None:
+            # adds them to the tree through _loaded
+            node = self._source.person(id)
+        return node
+
+    def attach(self, source) -> None:
+        """Read people from a tree file as they're reached, rather than all up front"""
+        self._source = source
+        self._all_read = False
+        source.on_load = self._loaded
+
+    def _loaded(self, node: Person) -> None:
+        # people in a tree file were saved connected and fixed
+        self.tree.add(node)
+        self._index(node)
+
+    def materialize(self) -> None:
+        """Read in everyone who hasn't been reached yet from the tree file"""
+        if self._source is None or self._all_read:
+            return
+        for id in self._source.ids():
+            self._source.person(id)
+        self._all_read = True
+
+    def close(self) -> None:
+        """Read in anyone not reached yet and let go of the tree file, if there is one"""
+        if self._source is None:
+            return
+        self.materialize()
+        self._source.close()
+        self._source = None
+
+    def __enter__(self) -> 'Tree':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def save(self, path: str) -> None:
+        """Save to a binary tree file"""
+        # tree_file imports this module
+        import tree_file
+        tree_file.save(self, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'Tree':
+        """Open a binary tree file, only reading people as they're reached"""
+        import tree_file
+        return tree_file.load(path)
 
     def rename(self, old: int, new: int):
+        self.materialize()
+        node = self._by_id.get(old)
+        if node is not None:
+            # the id is the hash, so it has to come out of every set before it changes
+            self.tree.discard(node)
+            self._unindex(node)
+            node.id = new
+            Person.seen_ids.add(new)
+            self.tree.add(node)
+            self._index(node)
         for node in self.tree:
-            if node.id == old:
-                node.id = new
             for fam in node.family:
                 if fam.person_id == old:
                     fam.person_id = new
+                    node.family_changed()
+        self._changed()
+
+    def set_name(self, node: Person, name: str) -> None:
+        """Change someone's name, keeping them findable by it"""
+        if self._by_id.get(node.id) is not node:
+            node.name = name
+            return
+        self._unindex(node)
+        node.name = name
+        self._index(node)
 
     def __str__(self) -> str:
         return str(self.tree)
 
     def __contains__(self, other: Person) -> bool:
-        return other in self.tree
+        # people still in the tree file count, they just haven't been read in
+        return other in self.tree or (self._source is not None and other.id in self._source)
 
     # def match(self, other: 'Tree', start: int, end: int) -> list[tuple[int, int]]:
     #     pass
@@ -0,0 +1,312 @@
+"""Streaming GEDCOM import and export
+
+Files are read a chunk at a time and handled one record at a time, so
+only the people being built are held in memory, not the file.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import DefaultDict, Iterable, Iterator, TextIO, Union
+import time
+
+from family_tree import Tree, Person, Relation, Gender, Family
+
+CHUNK_SIZE = 1 << 20
+
+GENDERS = {
+    'M': Gender.male,
+    'F': Gender.female,
+    'X': Gender.other,
+    'U': Gender.unknown,
+}
+SEXES = {gender: sex for sex, gender in GENDERS.items()}
+
+Line = tuple[int, Union[None, str], str, str]
+
+
+def _lines(f: TextIO, chunk_size: int=CHUNK_SIZE) -> Iterator[str]:
+    """Read a file a chunk at a time, giving back each line"""
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    if rest:
+        yield rest.rstrip('\r')
+
+
+def _parse(line: str) -> Union[None, Line]:
+    """Split a line into (level, xref, tag, value)"""
+    parts = line.strip().split(' ', 2)
+    if len(parts) < 2 or not parts[0].isdigit():
+        return None
+    level = int(parts[0])
+    xref = None
+    if parts[1].startswith('@'):
+        xref = parts[1]
+        parts = parts[2].split(' ', 1) if len(parts) > 2 else ['']
+    else:
+        parts = parts[1:]
+    tag = parts[0]
+    value = parts[1] if len(parts) > 1 else ''
+    return level, xref, tag, value
+
+
+def _records(lines: Iterable[str]) -> Iterator[list[Line]]:
+    """Group lines into records, each starting at a level 0 line"""
+    record: list[Line] = []
+    for line in lines:
+        parsed = _parse(line)
+        if parsed is None:
+            continue
+        if parsed[0] == 0 and record:
+            yield record
+            record = []
+        record.append(parsed)
+    if record:
+        yield record
+
+
+def _text(record: list[Line], i: int) -> str:
+    """Get a value along with any CONT/CONC lines continuing it"""
+    level, _, _, value = record[i]
+    for sub_level, _, tag, sub_value in record[i+1:]:
+        if sub_level <= level:
+            break
+        if sub_level == level + 1 and tag == 'CONT':
+            value += '\n' + sub_value
+        elif sub_level == level + 1 and tag == 'CONC':
+            value += sub_value
+    return value
+
+
+def _date(value: str) -> Union[None, date]:
+    try:
+        return datetime.strptime(value.strip().title(), '%d %b %Y').date()
+    except ValueError:
+        return None
+
+
+def _format_date(value: date) -> str:
+    return value.strftime('%d %b %Y').upper()
+
+
+class _Reader:
+    def __init__(self):
+        # GEDCOM xref -> person id, given out when an xref is first seen
+        self.ids: dict[str, int] = {}
+        self.people: dict[int, Person] = {}
+        # relations for people who haven't been read yet
+        self.pending: DefaultDict[int, list[Family]] = defaultdict(list)
+        # source xref -> title, and the people citing them
+        self.sources: dict[str, str] = {}
+        self.cited: list[Person] = []
+
+    def id(self, xref: str) -> int:
+        if xref not in self.ids:
+            self.ids[xref] = Person.curr_id
+            Person.curr_id += 1
+        return self.ids[xref]
+
+    def relate(self, id: int, family: Family) -> None:
+        if id in self.people:
+            self.people[id].family.append(family)
+        else:
+            self.pending[id].append(family)
+
+    def record(self, record: list[Line]) -> None:
+        _, xref, tag, value = record[0]
+        if tag == 'INDI' and xref:
+            self.individual(xref, record)
+        elif tag == 'FAM' and xref:
+            self.family(record)
+        elif tag == 'SOUR' and xref:
+            for i, (level, _, sub_tag, _) in enumerate(record):
+                if level == 1 and sub_tag == 'TITL':
+                    self.sources[xref] = _text(record, i)
+
+    def individual(self, xref: str, record: list[Line]) -> None:
+        person = Person('', id=self.id(xref))
+        event = None
+        for i, (level, _, tag, value) in enumerate(record[1:], 1):
+            if level == 1:
+                event = tag
+                if tag == 'NAME' and not person.name:
+                    person.name = ' '.join(value.replace('/', ' ').split())
+                elif tag == 'SEX':
+                    person.gender = GENDERS.get(value.strip()[:1].upper(), Gender.unknown)
+                elif tag == 'NOTE':
+                    person.notes = _text(record, i)
+                elif tag == 'SOUR':
+                    person.sources.append(_text(record, i))
+                    if value.startswith('@'):
+                        self.cited.append(person)
+            elif level == 2 and tag == 'DATE':
+                if event == 'BIRT':
+                    person.dob = value
+                elif event == 'DEAT':
+                    person.dod = value
+
+        # appended after they're made, as someone might be in more than one family
+        person.family.extend(self.pending.pop(person.id, ()))
+        self.people[person.id] = person
+
+    def family(self, record: list[Line]) -> None:
+        husband = wife = None
+        children: list[int] = []
+        married = divorced = None
+        event = None
+        for level, _, tag, value in record[1:]:
+            if level == 1:
+                event = tag
+                if tag == 'HUSB':
+                    husband = self.id(value.strip())
+                elif tag == 'WIFE':
+                    wife = self.id(value.strip())
+                elif tag == 'CHIL':
+                    children.append(self.id(value.strip()))
+            elif level == 2 and tag == 'DATE':
+                if event == 'MARR':
+                    married = _date(value)
+                elif event == 'DIV':
+                    divorced = _date(value)
+
+        if husband is not None and wife is not None:
+            self.relate(husband, Family(Relation.spouse, wife, start=married, end=divorced))
+        for child in children:
+            if husband is not None:
+                self.relate(child, Family(Relation.father, husband))
+            if wife is not None:
+                self.relate(child, Family(Relation.mother, wife))
+
+
+def read(path: str, tree: Tree=None, chunk_size: int=CHUNK_SIZE) -> Tree:
+    """Read a GEDCOM file into a tree"""
+    start = time.perf_counter()
+    reader = _Reader()
+    records = 0
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+        for record in _records(_lines(f, chunk_size)):
+            reader.record(record)
+            records += 1
+
+    # sources are often written after the people citing them
+    for person in reader.cited:
+        person.sources = [reader.sources.get(s, s) for s in person.sources]
+
+    if tree is None:
+        tree = Tree()
+    tree.extend(reader.people.values())
+
+    elapsed = time.perf_counter() - start
+    print(f'read {records} records in {elapsed:.2f}s ({records / max(elapsed, 1e-9):.0f} records/s)')
+    return tree
+
+
+def _families(tree: Tree) -> dict[tuple[Union[None, int], Union[None, int]], list[Person]]:
+    """Group children under their (husband, wife) couple, including couples without children"""
+    families: dict[tuple[Union[None, int], Union[None, int]], list[Person]] = {}
+    for person in tree.tree:
+        husband = wife = None
+        unknown = []
+        for f in person.family:
+            # parents never added to the tree have no record to point at
+            if f.relation.is_parent() and tree.get(f.person_id) is None:
+                continue
+            if f.relation == Relation.father:
+                husband = f.person_id
+            elif f.relation == Relation.mother:
+                wife = f.person_id
+            elif f.relation.is_parent():
+                unknown.append(f.person_id)
+        for id in unknown:
+            if husband is None:
+                husband = id
+            elif wife is None:
+                wife = id
+        if husband is not None or wife is not None:
+            families.setdefault((husband, wife), []).append(person)
+
+        for spouse in person.spouses:
+            if spouse is None:
+                continue
+            if person.gender == Gender.female or spouse.gender == Gender.male:
+                couple = (spouse.id, person.id)
+            elif person.gender == Gender.male or spouse.gender == Gender.female:
+                couple = (person.id, spouse.id)
+            else:
+                couple = (min(person.id, spouse.id), max(person.id, spouse.id))
+            families.setdefault(couple, [])
+
+    # a couple entered both ways round are the same family
+    for husband, wife in list(families):
+        if husband is not None and wife is not None and husband > wife and (wife, husband) in families:
+            families[(wife, husband)].extend(families.pop((husband, wife)))
+    return families
+
+
+def write(tree: Tree, path: str) -> None:
+    """Write a tree out as a GEDCOM file, a person at a time"""
+    start = time.perf_counter()
+    tree.materialize()
+
+    families = _families(tree)
+    family_ids = {couple: f'@F{i}@' for i, couple in enumerate(families, 1)}
+    child_of: DefaultDict[int, list[str]] = defaultdict(list)
+    spouse_in: DefaultDict[int, list[str]] = defaultdict(list)
+    for couple, children in families.items():
+        for child in children:
+            child_of[child.id].append(family_ids[couple])
+        for parent in couple:
+            if parent is not None:
+                spouse_in[parent].append(family_ids[couple])
+
+    records = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('0 HEAD\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n')
+
+        for person in sorted(tree.tree, key=lambda p: p.id):
+            f.write(f'0 @I{person.id}@ INDI\n')
+            f.write(f'1 NAME {person.name}\n')
+            f.write(f'1 SEX {SEXES[person.gender]}\n')
+            if person.dob:
+                f.write(f'1 BIRT\n2 DATE {person.dob}\n')
+            if person.dod:
+                f.write(f'1 DEAT\n2 DATE {person.dod}\n')
+            if person.notes:
+                f.write('1 NOTE ' + person.notes.replace('\n', '\n2 CONT ') + '\n')
+            for source in person.sources:
+                f.write('1 SOUR ' + source.replace('\n', '\n2 CONT ') + '\n')
+            for family_id in child_of[person.id]:
+                f.write(f'1 FAMC {family_id}\n')
+            for family_id in spouse_in[person.id]:
+                f.write(f'1 FAMS {family_id}\n')
+            records += 1
+
+        for couple, children in families.items():
+            husband, wife = couple
+            f.write(f'0 {family_ids[couple]} FAM\n')
+            if husband is not None:
+                f.write(f'1 HUSB @I{husband}@\n')
+            if wife is not None:
+                f.write(f'1 WIFE @I{wife}@\n')
+            if husband is not None and wife is not None:
+                marriage = next((
+                    fam for fam in tree.get(husband).family
+                    if fam.relation.is_spouse() and fam.person_id == wife
+                ), None)
+                if marriage is not None and marriage.start is not None:
+                    f.write(f'1 MARR\n2 DATE {_format_date(marriage.start)}\n')
+                if marriage is not None and marriage.end is not None:
+                    f.write(f'1 DIV\n2 DATE {_format_date(marriage.end)}\n')
+            for child in children:
+                f.write(f'1 CHIL @I{child.id}@\n')
+            records += 1
+
+        f.write('0 TRLR\n')
+
+    elapsed = time.perf_counter() - start
+    print(f'wrote {records} records in {elapsed:.2f}s ({records / max(elapsed, 1e-9):.0f} records/s)')
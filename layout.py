@@ -0,0 +1,1021 @@
+"""Places people into generation rows, working out from the head of the tree"""
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Container, DefaultDict, Iterator, Literal, Mapping, NamedTuple, Union
+import math
+import time
+
+from family_tree import Tree, Person, Gender
+
+# labels are spread over this many bits, rows never get close to needing them all
+LABEL_BITS = 62
+# how much sparser each larger window of labels has to be before it's relabelled
+DENSITY = 1.5
+
+PERSON_WIDTH = 300
+ROW_HEIGHT = 300
+# most times untangle() goes down and back up the rows
+UNTANGLE_SWEEPS = 8
+
+
+class _Entry:
+    """A person's place in a row"""
+    __slots__ = ('person', 'label', 'prev', 'next', 'row')
+
+    def __init__(self, person: Person, row: 'Row'):
+        self.person = person
+        self.label = 0
+        self.prev: Union[None, _Entry] = None
+        self.next: Union[None, _Entry] = None
+        self.row = row
+
+
+class Row:
+    """The people in one generation, left to right
+
+    A linked list where every entry also has an integer label that increases
+    left to right, so inserting next to someone and telling which of two people
+    is further left are both cheap. When there's no gap for a new label the
+    smallest window around it that isn't too crowded is relabelled evenly.
+
+    Some entries can also be marked, on either of two sides, and the nearest
+    marked entry to the left or right of anyone is found by searching the
+    marked entries' labels, rather than walking the row.
+    """
+    def __init__(self):
+        self.first: Union[None, _Entry] = None
+        self.last: Union[None, _Entry] = None
+        self.size = 0
+        # the marked entries for each side, left to right
+        self.marked: tuple[list[_Entry], list[_Entry]] = ([], [])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def reorder(self, entries: list[_Entry]) -> None:
+        """Link the row's entries up again in a new order, labelled evenly"""
+        self.first = self.last = None
+        self.size = 0
+        step = (1 << LABEL_BITS) // (len(entries) + 1)
+        for i, entry in enumerate(entries):
+            entry.prev = self.last
+            entry.next = None
+            if self.last is None:
+                self.first = entry
+            else:
+                self.last.next = entry
+            self.last = entry
+            entry.label = step * (i + 1)
+            self.size += 1
+        for marked in self.marked:
+            marked.sort(key=lambda entry: entry.label)
+
+    def __iter__(self) -> Iterator[Person]:
+        entry = self.first
+        while entry is not None:
+            yield entry.person
+            entry = entry.next
+
+    def append(self, entry: _Entry) -> None:
+        if self.last is None:
+            entry.label = 1 << (LABEL_BITS - 1)
+            self.first = self.last = entry
+            self.size = 1
+        else:
+            self.insert_after(self.last, entry)
+
+    def insert_before(self, old: _Entry, entry: _Entry) -> None:
+        if old.prev is not None:
+            self.insert_after(old.prev, entry)
+            return
+        entry.next = old
+        old.prev = entry
+        self.first = entry
+        self.size += 1
+        self._label(entry)
+
+    def insert_after(self, old: _Entry, entry: _Entry) -> None:
+        entry.prev = old
+        entry.next = old.next
+        if old.next is not None:
+            old.next.prev = entry
+        else:
+            self.last = entry
+        old.next = entry
+        self.size += 1
+        self._label(entry)
+
+    def mark(self, entry: _Entry, side: int, on: bool) -> None:
+        """Mark or unmark an entry on the left (0) or right (1) side"""
+        marked = self.marked[side]
+        i = _bisect(marked, entry.label)
+        if i < len(marked) and marked[i] is entry:
+            if not on:
+                del marked[i]
+        elif on:
+            marked.insert(i, entry)
+
+    def nearest_marked(self, entry: _Entry, side: int) -> Union[None, _Entry]:
+        """The nearest entry marked on a side, left of an entry for the left (0) or right of it for the right (1)"""
+        marked = self.marked[side]
+        if side == 0:
+            i = _bisect(marked, entry.label) - 1
+            return marked[i] if i >= 0 else None
+        i = _bisect(marked, entry.label + 1)
+        return marked[i] if i < len(marked) else None
+
+    def _label(self, entry: _Entry) -> None:
+        low = entry.prev.label if entry.prev is not None else -1
+        high = entry.next.label if entry.next is not None else 1 << LABEL_BITS
+        if high - low > 1:
+            entry.label = (low + high) // 2
+            return
+        self._relabel(entry)
+
+    def _relabel(self, entry: _Entry) -> None:
+        # the entry is linked in but has no label, so centre the window on a neighbour
+        base = (entry.prev if entry.prev is not None else entry.next).label
+        left = right = entry
+        count = 1
+        # grow the window until it's sparse enough, smaller windows may be fuller
+        for bits in range(1, LABEL_BITS + 1):
+            size = 1 << bits
+            low = base & ~(size - 1)
+            high = low + size
+            while left.prev is not None and left.prev.label >= low:
+                left = left.prev
+                count += 1
+            while right.next is not None and right.next.label < high:
+                right = right.next
+                count += 1
+            if count <= size / DENSITY ** bits:
+                break
+        else:
+            raise OverflowError('too many people in one row')
+
+        # spread the labels in the window evenly
+        step = size // (count + 1)
+        label = low
+        current = left
+        while True:
+            label += step
+            current.label = label
+            if current is right:
+                break
+            current = current.next
+
+
+def _bisect(entries: list[_Entry], label: int) -> int:
+    """Where an entry labelled `label` goes in entries sorted by label, before any with the same label"""
+    low, high = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if entries[middle].label < label:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _crossings(lines: list[tuple[int, int]], size: int) -> int:
+    """How many pairs of lines between two rows cross, given each line's place at the top and bottom
+
+    Lines sorted by their top cross wherever their bottoms are out of order,
+    which are counted with a Fenwick tree over the `size` places at the bottom.
+    """
+    counts = [0] * (size + 1)
+    crossings = 0
+    for seen, (_, bottom) in enumerate(sorted(lines)):
+        # lines so far that end left of or at this one don't cross it
+        i = bottom + 1
+        while i > 0:
+            seen -= counts[i]
+            i -= i & -i
+        crossings += seen
+        i = bottom + 1
+        while i <= size:
+            counts[i] += 1
+            i += i & -i
+    return crossings
+
+
+class Untangled(NamedTuple):
+    """What Layout.untangle() did"""
+    crossings_before: int
+    crossings_after: int
+    sweeps: int
+    seconds: float
+
+    @property
+    def per_ms(self) -> float:
+        """Crossings taken out per millisecond"""
+        return (self.crossings_before - self.crossings_after) / max(self.seconds * 1000, 1e-9)
+
+
+class _Relative:
+    """Just enough of a Person to be laid out, so a branch can be sent to another process"""
+    __slots__ = ('id', 'gender', 'blood', 'parents', 'children', 'spouses', 'siblings')
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+# id, gender, blood, then the ids of their parents, children, spouses and siblings
+Record = tuple[int, Gender, bool, tuple[int, ...], tuple[int, ...], tuple[int, ...], tuple[int, ...]]
+# a branch's root, everyone in it, and the id, gender and blood of spouses from outside it
+Branch = tuple[int, list[Record], list[tuple[int, Gender, bool]]]
+
+
+def _layout_branch(branch: Branch) -> tuple[dict[int, list[int]], dict[int, int]]:
+    """Lay out a branch from its root, giving back the ids in each row and who each was found from"""
+    root, records, outside = branch
+    relatives: dict[int, _Relative] = {}
+    for id, gender, blood, *_ in records:
+        relatives[id] = _Relative()
+    for id, gender, blood in outside:
+        relative = relatives[id] = _Relative()
+        relative.id, relative.gender, relative.blood = id, gender, blood
+        relative.parents = relative.children = relative.spouses = relative.siblings = ()
+    for id, gender, blood, parents, children, spouses, siblings in records:
+        relative = relatives[id]
+        relative.id, relative.gender, relative.blood = id, gender, blood
+        relative.parents = tuple(relatives[i] for i in parents)
+        relative.children = tuple(relatives[i] for i in children)
+        relative.spouses = tuple(relatives[i] for i in spouses)
+        relative.siblings = tuple(relatives[i] for i in siblings)
+
+    # spouses from outside the branch are only there so their blood can be checked
+    layout = Layout(None, {relatives[record[0]] for record in records}).run(relatives[root])
+    rows = {g: [person.id for person in row] for g, row in layout.rows.items()}
+    came_from = {person.id: previous.id for person, previous in layout.came_from.items() if previous is not None}
+    return rows, came_from
+
+
+def _layout_branches(branches: list[Branch]) -> list[tuple[dict[int, list[int]], dict[int, int]]]:
+    return [_layout_branch(branch) for branch in branches]
+
+
+class Layout:
+    """Places everyone reachable from the head into rows, one generation per row
+
+    Generations count up from the head, so parents are +1 and children are -1.
+    """
+    def __init__(self, tree: Tree, people: Container[Person]):
+        self.tree = tree
+        self.people = people
+        self.rows: DefaultDict[int, Row] = defaultdict(Row)
+        self.gen: dict[Person, int] = {}
+        # who each person was found from, following it back leads to the head
+        self.came_from: dict[Person, Union[None, Person]] = {}
+        self._entries: dict[Person, _Entry] = {}
+        # person -> row -> [leftmost, rightmost] placed descendant in that row
+        self._extents: dict[Person, dict[int, list[Person]]] = {}
+
+        self.smallest_g = 0
+        self.largest_g = 0
+
+    def placed(self, person: Person) -> bool:
+        return person in self._entries
+
+    def left_of(self, a: Person, b: Person) -> bool:
+        """If a is further left than b"""
+        return self._entries[a].label < self._entries[b].label
+
+    def walk_left(self, person: Person, include_self: bool=False) -> Iterator[Person]:
+        """Everyone in the person's row to their left, nearest first"""
+        entry = self._entries[person]
+        if not include_self:
+            entry = entry.prev
+        while entry is not None:
+            yield entry.person
+            entry = entry.prev
+
+    def walk_right(self, person: Person) -> Iterator[Person]:
+        """Everyone in the person's row to their right, nearest first"""
+        entry = self._entries[person].next
+        while entry is not None:
+            yield entry.person
+            entry = entry.next
+
+    def seen_path(self, person: Person) -> Iterator[Person]:
+        """Everyone passed through on the way from the head to a person, nearest first"""
+        person = self.came_from[person]
+        while person is not None:
+            yield person
+            person = self.came_from[person]
+
+    def generation_rows(self) -> DefaultDict[int, list[Person]]:
+        return defaultdict(list, {g: list(row) for g, row in self.rows.items()})
+
+    def row_y(self, g: int) -> float:
+        """Where the centre of a generation's row goes, the oldest at the top"""
+        return (self.largest_g - g + self.smallest_g) * ROW_HEIGHT + 60
+
+    def positions(self, person_width: int=PERSON_WIDTH) -> dict[Person, tuple[float, float]]:
+        """Where the centre of everyone placed goes, each row centred on x = 0"""
+        positions: dict[Person, tuple[float, float]] = {}
+        generations_size = self.largest_g - self.smallest_g
+        for generation in range(generations_size+1):
+            row = self.rows[generation+self.smallest_g]
+            y = self.row_y(generation+self.smallest_g)
+            for i, person in enumerate(row):
+                positions[person] = ((i - len(row)/2)*person_width, y)
+        return positions
+
+    def _units(self) -> tuple[list[list[Person]], dict[Person, int]]:
+        """Couples (and more, for anyone married more than once) in a row, left to right"""
+        unit_of: dict[Person, int] = {}
+        units: list[list[Person]] = []
+        for person in self._entries:
+            if person in unit_of:
+                continue
+            members = []
+            stack = [person]
+            unit_of[person] = len(units)
+            while stack:
+                member = stack.pop()
+                members.append(member)
+                for spouse in member.spouses:
+                    if self.placed(spouse) and spouse not in unit_of and self.gen[spouse] == self.gen[member]:
+                        unit_of[spouse] = len(units)
+                        stack.append(spouse)
+            members.sort(key=lambda member: self._entries[member].label)
+            units.append(members)
+        return units, unit_of
+
+    def crossings(self) -> int:
+        """How many pairs of parent to child lines cross between rows"""
+        index = {person: i for row in self.rows.values() for i, person in enumerate(row)}
+        return sum(self._row_crossings(g, index) for g in self.rows)
+
+    def _row_crossings(self, g: int, index: Mapping[Person, int]) -> int:
+        """Crossings between a row and the one above it"""
+        if g + 1 not in self.rows:
+            return 0
+        lines = [
+            (index[parent], index[person])
+            for person in self.rows[g]
+            for parent in person.parents
+            if self.gen.get(parent) == g + 1
+        ]
+        return _crossings(lines, len(self.rows[g]))
+
+    def untangle(self, sweeps: int=UNTANGLE_SWEEPS, median: bool=False) -> 'Untangled':
+        """Reorder the rows so fewer lines between parents and children cross
+
+        The usual layered graph heuristic: going down the rows each couple
+        is sorted by the average (or with `median`, the median) place of
+        their parents in the row above, then going back up by their
+        children's, for at most `sweeps` times down and up. Couples are
+        kept together, and the best order found is kept. Call it after
+        run(), the rows are just put in order again so nothing else moves.
+        """
+        start = time.perf_counter()
+        units, _ = self._units()
+        index = {person: i for row in self.rows.values() for i, person in enumerate(row)}
+        row_units: DefaultDict[int, list[list[Person]]] = defaultdict(list)
+        for members in sorted(units, key=lambda members: index[members[0]]):
+            row_units[self.gen[members[0]]].append(members)
+
+        def reorder(g: int, toward: int) -> None:
+            row = row_units[g]
+            scale = len(self.rows[toward]) / max(len(self.rows[g]), 1)
+            keys = []
+            for members in row:
+                near = sorted(
+                    index[other]
+                    for member in members
+                    for other in (member.parents if toward > g else member.children)
+                    if self.gen.get(other) == toward
+                )
+                if not near:
+                    # nothing to pull them either way, so they stay about where they are
+                    keys.append(index[members[0]] * scale)
+                elif median:
+                    keys.append((near[(len(near) - 1) // 2] + near[len(near) // 2]) / 2)
+                else:
+                    keys.append(sum(near) / len(near))
+            row[:] = [members for _, members in sorted(zip(keys, row), key=lambda pair: pair[0])]
+            i = 0
+            for members in row:
+                for member in members:
+                    index[member] = i
+                    i += 1
+
+        gs = sorted(self.rows, reverse=True)
+        before = best = sum(self._row_crossings(g, index) for g in gs)
+        # the rows as they are, couples may be apart in them, stay unless a sweep does better
+        best_order: Union[None, dict[int, list[Person]]] = None
+        done = 0
+        for done in range(1, sweeps + 1):
+            for g in gs[1:]:
+                if g + 1 in self.rows:
+                    reorder(g, g + 1)
+            for g in reversed(gs[:-1]):
+                if g - 1 in self.rows:
+                    reorder(g, g - 1)
+            crossings = sum(self._row_crossings(g, index) for g in gs)
+            if crossings >= best:
+                break
+            best = crossings
+            best_order = {g: [m for members in row_units[g] for m in members] for g in gs}
+
+        if best_order is not None:
+            for g, order in best_order.items():
+                self.rows[g].reorder([self._entries[person] for person in order])
+        return Untangled(before, best, done, time.perf_counter() - start)
+
+    def _place(self, new: Person) -> _Entry:
+        entry = _Entry(new, self.rows[self.gen[new]])
+        self._entries[new] = entry
+        return entry
+
+    def add_left(self, person: Person, new: Person, update_path: bool=True):
+        assert self.gen[person] == self.gen[new]
+        if update_path:
+            self.came_from[new] = person
+        old = self._entries[person]
+        old.row.insert_before(old, self._place(new))
+        self._update_extents(new)
+
+    def add_right(self, person: Person, new: Person, update_path: bool=True):
+        assert self.gen[person] == self.gen[new]
+        if update_path:
+            self.came_from[new] = person
+        old = self._entries[person]
+        old.row.insert_after(old, self._place(new))
+        self._update_extents(new)
+
+    def _start_row(self, new: Person) -> bool:
+        """Put someone in their row if it's empty"""
+        row = self.rows[self.gen[new]]
+        if len(row):
+            return False
+        row.append(self._place(new))
+        self._update_extents(new)
+        return True
+
+    def add_parent(self, person: Person, new: Person):
+        assert self.gen[person] + 1 == self.gen[new]
+        # if there's no people yet
+        if self._start_row(new):
+            return
+
+        # if they have a spouse
+        for parent in person.parents:
+            if not self.placed(parent):
+                continue
+
+            if new.gender == Gender.male:
+                self.add_left(parent, new, False)
+                return
+            else:
+                self.add_right(parent, new, False)
+                return
+
+        # if there's a person on their left
+        for p in self.walk_left(person, include_self=True):
+            value = None
+            for p2 in p.parents:
+                if self.placed(p2):
+                    if value is None or self.left_of(value, p2):
+                        value = p2
+            if value is not None:
+                self.add_right(value, new, False)
+                return
+
+        # if there's a person on their right
+        for p in self.walk_right(person):
+            value = None
+            for p2 in p.parents:
+                if self.placed(p2):
+                    if value is None or self.left_of(p2, value):
+                        value = p2
+            if value is not None:
+                self.add_left(value, new, False)
+                return
+
+    def get_child_row(self, person: Person, row: int, dir: Literal['left', 'right']) -> Union[None, Person]:
+        """Get the leftmost or rightmost of someone's placed descendants in a row"""
+        if not self.placed(person):
+            return
+        if self.gen[person] == row:
+            return person
+        extent = self._extents[person].get(row)
+        if extent is None:
+            return
+        if dir == 'left':
+            return extent[0]
+        else:
+            return extent[1]
+
+    def _extent(self, person: Person, row: int) -> tuple[Person, Person]:
+        if self.gen[person] == row:
+            return person, person
+        left, right = self._extents[person][row]
+        return left, right
+
+    def _rows(self, person: Person) -> list[int]:
+        return [self.gen[person], *self._extents[person]]
+
+    def _merge(self, person: Person, row: int, left: Person, right: Person) -> bool:
+        """Widen someone's extent in a row, returns if it changed"""
+        if row == self.gen[person]:
+            return False
+        extent = self._extents[person].get(row)
+        if extent is None:
+            self._extents[person][row] = [left, right]
+            return True
+        changed = False
+        if self.left_of(left, extent[0]):
+            extent[0] = left
+            changed = True
+        if self.left_of(extent[1], right):
+            extent[1] = right
+            changed = True
+        return changed
+
+    def _update_extents(self, new: Person) -> None:
+        """Fold a newly placed person into their own and their ancestors' extents"""
+        self._extents[new] = {}
+        for child in new.children:
+            if self.placed(child):
+                for row in self._rows(child):
+                    self._merge(new, row, *self._extent(child, row))
+        self._mark_children(new)
+
+        stack = [(new, self._rows(new))]
+        while stack:
+            person, rows = stack.pop()
+            for parent in person.parents:
+                if not self.placed(parent):
+                    continue
+                changed = [
+                    row for row in rows
+                    if self._merge(parent, row, *self._extent(person, row))
+                ]
+                if changed:
+                    if self.gen[parent] - 1 in changed:
+                        self._mark_children(parent)
+                    stack.append((parent, changed))
+
+    def _mark_children(self, person: Person) -> None:
+        """Mark someone on the side their outermost child can have a new sibling put beside
+
+        add_child() looks left for someone whose rightmost child can have
+        someone put on their right, which is the left (0) side, and right
+        for someone whose leftmost child can have someone on their left.
+        """
+        entry = self._entries[person]
+        extent = self._extents[person].get(self.gen[person] - 1)
+        for side in (0, 1):
+            child = None if extent is None else extent[1 - side]
+            entry.row.mark(entry, side, child is not None and not (
+                child.blood and any(spouse.blood for spouse in child.spouses)
+            ))
+
+    def add_child(self, person: Person, new: Person):
+        assert self.gen[person] - 1 == self.gen[new]
+        # if there's no people yet
+        if self._start_row(new):
+            return
+
+        entry = self._entries[person]
+        # if child is on the left
+        left = entry.row.nearest_marked(entry, 0)
+        if left is not None:
+            self.add_right(self.get_child_row(left.person, self.gen[new], 'right'), new, False)
+            return
+        # if child is on the right
+        right = entry.row.nearest_marked(entry, 1)
+        if right is not None:
+            self.add_left(self.get_child_row(right.person, self.gen[new], 'left'), new, False)
+            return
+
+        for p in self.seen_path(new):
+            if self.gen[p] == self.gen[new]:
+                if p.gender == Gender.male:
+                    self.add_left(p, new, False)
+                    return
+                else:
+                    self.add_right(p, new, False)
+                    return
+
+        # no one nearby has anyone in that row, so it goes on the end
+        self.add_right(self.rows[self.gen[new]].last.person, new, False)
+
+    def run(self, head: Union[None, Person]=None) -> 'Layout':
+        """Place everyone in `people` that can be reached from the head, or from `head` if given"""
+        if head is None:
+            head = self.tree.head
+        self.gen[head] = 0
+        self.came_from[head] = None
+        self._start_row(head)
+        next_add = {head}
+        seen = {head.id}
+
+        while next_add:
+            person = next_add.pop()
+            self.smallest_g = min(self.gen[person], self.smallest_g)
+            self.largest_g = max(self.gen[person], self.largest_g)
+            for sibling in person.siblings:
+                if sibling.id in seen:
+                    continue
+                if sibling not in self.people:
+                    continue
+                self.gen[sibling] = self.gen[person]
+                self.came_from[sibling] = person
+                if person.gender == Gender.male:
+                    self.add_left(person, sibling)
+                else:
+                    self.add_right(person, sibling)
+
+                assert self.placed(sibling)
+                next_add.add(sibling)
+                seen.add(sibling.id)
+
+            for spouse in person.spouses:
+                if spouse.id in seen:
+                    continue
+                if spouse not in self.people:
+                    continue
+                self.gen[spouse] = self.gen[person]
+                self.came_from[spouse] = person
+                if person.gender == Gender.male:
+                    self.add_right(person, spouse)
+                else:
+                    self.add_left(person, spouse)
+
+                assert self.placed(spouse)
+                seen.add(spouse.id)
+
+            for parent in person.parents:
+                if parent.id in seen:
+                    continue
+                if parent not in self.people:
+                    continue
+                self.gen[parent] = self.gen[person] + 1
+                self.came_from[parent] = person
+                self.add_parent(person, parent)
+
+                assert self.placed(parent)
+                next_add.add(parent)
+                seen.add(parent.id)
+
+            for child in person.children:
+                if child.id in seen:
+                    continue
+                if child not in self.people:
+                    continue
+                self.gen[child] = self.gen[person] - 1
+                self.came_from[child] = person
+                self.add_child(person, child)
+
+                assert self.placed(child)
+                next_add.add(child)
+                seen.add(child.id)
+
+        return self
+
+    def run_branches(self, workers: int=0) -> 'Layout':
+        """Like run(), but every branch off the head's line is laid out by itself
+
+        The head, their ancestors and their descendants are placed by run().
+        Every other blood relative in `people` comes down from an ancestor
+        through one of their children who isn't an ancestor, and each of
+        those children's descendants is a branch, laid out on `workers`
+        processes if given. The branches' rows are put beside the line's,
+        nearer ancestors' closest in, on the side run() would put siblings.
+
+        run() takes longer the longer the rows are, so this is quicker even
+        on one process. Relatives in different branches who married each
+        other aren't put together the way run() would though.
+        """
+        blood = self.tree.blood_relatives()
+        relatives = [person for person in blood if person in self.people]
+        line = {person for person in relatives if blood[person].generation == blood[person].level}
+        people = self.people
+        self.people = {person for person in relatives if person in line or blood[person].level == 0}
+        self.run()
+        self.people = people
+
+        # nearest ancestors first, then left to right
+        ancestors = sorted(
+            (person for person in line if self.placed(person)),
+            key=lambda person: (blood[person].level, self._entries[person].label),
+        )
+        claimed = set(self._entries)
+        # root, the ancestor they're a child of, everyone in the branch, and its side
+        branches: list[tuple[Person, Person, list[Person], int]] = []
+        for ancestor in ancestors:
+            on_line = [child for child in ancestor.children if child in line and self.placed(child)]
+            side = 0 if on_line and on_line[0].gender == Gender.male else 1
+            for root in ancestor.children:
+                if root in claimed or root not in blood or root not in self.people:
+                    continue
+                claimed.add(root)
+                members = [root]
+                for person in members:
+                    for child in person.children:
+                        if child not in claimed and child in blood and child in self.people:
+                            claimed.add(child)
+                            members.append(child)
+                branches.append((root, ancestor, members, side))
+
+        jobs = [self._branch(root, members) for root, _, members, _ in branches]
+        if workers:
+            # biggest first, each to whichever worker has least to do so far
+            loads = [[0, []] for _ in range(workers)]
+            for i in sorted(range(len(jobs)), key=lambda i: -len(jobs[i][1])):
+                load = min(loads, key=lambda load: load[0])
+                load[0] += len(jobs[i][1])
+                load[1].append(i)
+            results: list = [None] * len(jobs)
+            with ProcessPoolExecutor(workers) as pool:
+                for (_, batch), laid_out in zip(loads, pool.map(_layout_branches, [[jobs[i] for i in batch] for _, batch in loads])):
+                    for i, result in zip(batch, laid_out):
+                        results[i] = result
+        else:
+            results = list(map(_layout_branch, jobs))
+
+        # each row's pieces from branches on the left and right, nearest first
+        left: DefaultDict[int, list[list[Person]]] = defaultdict(list)
+        right: DefaultDict[int, list[list[Person]]] = defaultdict(list)
+        for (root, ancestor, members, side), (rows, came_from) in zip(branches, results):
+            by_id = {person.id: person for person in members}
+            offset = self.gen[ancestor] - 1
+            for g, ids in rows.items():
+                piece = [by_id[id] for id in ids]
+                for person in piece:
+                    self.gen[person] = g + offset
+                (left if side == 0 else right)[g + offset].append(piece)
+            for id, previous in came_from.items():
+                self.came_from[by_id[id]] = by_id[previous]
+            self.came_from[root] = ancestor
+
+        for g in set(left) | set(right):
+            self.smallest_g = min(g, self.smallest_g)
+            self.largest_g = max(g, self.largest_g)
+            row = self.rows[g]
+            order = [
+                *(person for piece in reversed(left[g]) for person in piece),
+                *row,
+                *(person for piece in right[g] for person in piece),
+            ]
+            row.reorder([self._entries[person] if self.placed(person) else self._place(person) for person in order])
+        return self
+
+    def _branch(self, root: Person, members: list[Person]) -> Branch:
+        """A branch as plain ids, to send to another process"""
+        inside = set(members)
+        records = [
+            (
+                person.id, person.gender, person.blood,
+                *(
+                    tuple(other.id for other in others if other in inside)
+                    for others in (person.parents, person.children, person.spouses, person.siblings)
+                ),
+            )
+            for person in members
+        ]
+        outside = {
+            spouse.id: (spouse.id, spouse.gender, spouse.blood)
+            for person in members
+            for spouse in person.spouses
+            if spouse not in inside
+        }
+        return root.id, records, list(outside.values())
+
+
+class _Outline:
+    """The left and right edge of a piece of the tree in each row, all moved along by dx"""
+    __slots__ = ('rows', 'dx')
+
+    def __init__(self):
+        self.rows: dict[int, list[float]] = {}
+        self.dx = 0.0
+
+    def add(self, row: int, left: float, right: float) -> None:
+        left, right = left - self.dx, right - self.dx
+        edges = self.rows.get(row)
+        if edges is None:
+            self.rows[row] = [left, right]
+        else:
+            edges[0] = min(edges[0], left)
+            edges[1] = max(edges[1], right)
+
+    def edge(self, row: int, side: int) -> Union[None, float]:
+        """The left (0) or right (1) edge of a row, if anything's in it"""
+        edges = self.rows.get(row)
+        return None if edges is None else edges[side] + self.dx
+
+
+def _clearance(left: _Outline, right: _Outline) -> float:
+    """How far `right` has to move right to clear `left` in every row they share"""
+    need = -math.inf
+    # only the shorter outline needs walking, as in Reingold and Tilford's tidy trees
+    for row in (left.rows if len(left.rows) < len(right.rows) else right.rows):
+        if row in left.rows and row in right.rows:
+            need = max(need, left.rows[row][1] + left.dx - right.rows[row][0] - right.dx)
+    return need
+
+
+def _merge(a: _Outline, b: _Outline, shift: float) -> _Outline:
+    """One outline around both, b moved by `shift` first, reusing whichever has more rows"""
+    b.dx += shift
+    if len(a.rows) < len(b.rows):
+        a, b = b, a
+    for row, (left, right) in b.rows.items():
+        a.add(row, left + b.dx, right + b.dx)
+    return a
+
+
+class TidyLayout(Layout):
+    """Puts people in the same rows as Layout, then works out x as a tidy tree
+
+    Anyone married to someone in their row is laid out with them as one unit.
+    From the head's unit the tree is walked out like Layout does: children
+    hang below a unit, and each member's parents sit above them, the
+    husband's side of the family to the left and the wife's to the right.
+    Every piece of the tree is pushed up against the ones beside it as
+    closely as their outlines allow and the unit above is centred over it,
+    the same as Reingold and Tilford's tidy trees, so it takes time in
+    proportion to the number of people.
+
+    `widths` is how much room each person takes, gap included, everyone
+    takes `person_width` without it.
+    """
+    def __init__(self, tree: Tree, people: Container[Person], widths: Union[None, Mapping[Person, float]]=None):
+        super().__init__(tree, people)
+        self.widths = widths
+
+    def untangle(self, sweeps: int=UNTANGLE_SWEEPS, median: bool=False) -> Untangled:
+        """Not for tidy layouts, which work out x from the tree and not the order of the rows"""
+        raise ValueError("a tidy layout doesn't follow the order of the rows, so it can't be untangled")
+
+    @staticmethod
+    def _side(members: list[Person], member: Person) -> int:
+        """Which side of a unit a member's parents go, 0 for left and 1 for right"""
+        i = members.index(member)
+        if 2*i + 1 == len(members):
+            # siblings go left of a man and right of a woman, like Layout puts them
+            return 0 if member.gender == Gender.male else 1
+        return 0 if 2*i < len(members) else 1
+
+    def positions(self, person_width: int=PERSON_WIDTH) -> dict[Person, tuple[float, float]]:
+        units, unit_of = self._units()
+        width = [
+            [person_width if self.widths is None else self.widths[member] for member in members]
+            for members in units
+        ]
+
+        # walk out from the head, each unit hangs off the one it was found from
+        below: list[list[int]] = [[] for _ in units]
+        # parents' unit, the member of this one they're parents of, and their side
+        above: list[list[tuple[int, Person, int]]] = [[] for _ in units]
+        order: list[int] = []
+        roots: list[int] = []
+        seen = [False] * len(units)
+        head = unit_of[self.tree.head]
+        for start in (head, *range(len(units))):
+            if seen[start]:
+                continue
+            seen[start] = True
+            roots.append(start)
+            queue = deque([start])
+            while queue:
+                u = queue.popleft()
+                order.append(u)
+                for member in units[u]:
+                    for parent in member.parents:
+                        p = unit_of.get(parent)
+                        if p is not None and not seen[p]:
+                            seen[p] = True
+                            above[u].append((p, member, self._side(units[u], member)))
+                            queue.append(p)
+                    for child in member.children:
+                        c = unit_of.get(child)
+                        if c is not None and not seen[c]:
+                            seen[c] = True
+                            below[u].append(c)
+                            queue.append(c)
+        for u in order:
+            above[u].sort(key=lambda up: up[2])
+
+        # each unit's centre is in the frame of the unit it's anchored to, moved along by shift
+        anchor: list[Union[None, int]] = [None] * len(units)
+        shift = [0.0] * len(units)
+        center = [0.0] * len(units)
+
+        def member_x(u: int, member: Person) -> float:
+            i = units[u].index(member)
+            return center[u] - sum(width[u]) / 2 + sum(width[u][:i]) + width[u][i] / 2
+
+        def hang(kids: list[int], owner: int) -> tuple[_Outline, list[float]]:
+            """Lay out each unit and everything off it, then put them side by side in owner's frame"""
+            outline = _Outline()
+            tops = []
+            for c in kids:
+                piece = build(c)
+                anchor[c] = owner
+                need = _clearance(outline, piece)
+                shift[c] = 0.0 if need == -math.inf else need
+                outline = _merge(outline, piece, shift[c])
+                tops.append(center[c] + shift[c])
+            return outline, tops
+
+        def build(u: int) -> _Outline:
+            """The outline of a unit with their descendants below and ancestors above, in their own frame"""
+            outline, tops = hang(below[u], u)
+            center[u] = (tops[0] + tops[-1]) / 2 if tops else 0.0
+            half = sum(width[u]) / 2
+            row = self.gen[units[u][0]]
+            left, right = outline.edge(row, 0), outline.edge(row, 1)
+            if left is not None and center[u] + half > left and center[u] - half < right:
+                # a child married to a cousin brings their in-laws into this
+                # row, so go beside them, on whichever side is nearer
+                center[u] = left - half if center[u] - left < right - center[u] else right + half
+            outline.add(row, center[u] - half, center[u] + half)
+            for p, member, side in above[u]:
+                outline = raise_parents(u, p, member_x(u, member), side, outline)
+            return outline
+
+        def raise_parents(owner: int, p: int, x: float, side: int, outline: _Outline) -> _Outline:
+            """Put a member's parents over them and the rest of their children beside what's there
+
+            Everything goes straight into owner's frame, around what's already
+            in `outline`, so the siblings and their families wrap around the
+            member's own.
+            """
+            siblings, tops = hang(below[p], owner)
+            if siblings.rows:
+                if side == 0:
+                    need = _clearance(siblings, outline)
+                    move = 0.0 if need == -math.inf else -need
+                else:
+                    need = _clearance(outline, siblings)
+                    move = 0.0 if need == -math.inf else need
+                for c in below[p]:
+                    shift[c] += move
+                tops = [top + move for top in tops]
+                outline = _merge(outline, siblings, move)
+            tops.append(x)
+
+            # over the middle of their children, unless someone's already there
+            anchor[p] = owner
+            row = self.gen[units[p][0]]
+            half = sum(width[p]) / 2
+            center[p] = (min(tops) + max(tops)) / 2
+            edge = outline.edge(row, side)
+            if edge is not None:
+                center[p] = min(center[p], edge - half) if side == 0 else max(center[p], edge + half)
+            outline.add(row, center[p] - half, center[p] + half)
+            for grandparents, member, member_side in above[p]:
+                outline = raise_parents(owner, grandparents, member_x(p, member), member_side, outline)
+            return outline
+
+        pieces = [build(root) for root in roots]
+        # trees that can't be reached from the head's go to its right
+        outline = pieces[0]
+        for root, piece in zip(roots[1:], pieces[1:]):
+            need = _clearance(outline, piece)
+            shift[root] = 0.0 if need == -math.inf else need
+            outline = _merge(outline, piece, shift[root])
+
+        # add up the shifts, anchors are always found before what's anchored to them
+        frame = [0.0] * len(units)
+        for u in order:
+            frame[u] = shift[u] + (0.0 if anchor[u] is None else frame[anchor[u]])
+
+        positions: dict[Person, tuple[float, float]] = {}
+        for u, members in enumerate(units):
+            x = frame[u] + center[u] - sum(width[u]) / 2
+            for member, room in zip(members, width[u]):
+                positions[member] = (x + room/2, self.row_y(self.gen[member]))
+                x += room
+        # centred on the head
+        head_x = positions[self.tree.head][0]
+        return {person: (x - head_x, y) for person, (x, y) in positions.items()}
+
+
+def layout_tree(
+        tree: Tree,
+        generations: int,
+        person_width: int=PERSON_WIDTH,
+        tidy: bool=False,
+        untangle: bool=False,
+        workers: Union[None, int]=None,
+    ) -> dict[Person, tuple[float, float]]:
+    """Lay out the head's blood relatives up to `generations` up, without pygame
+
+    With `workers` each branch off the head's line is laid out apart, see
+    Layout.run_branches(). `untangle` can't be used with `tidy`.
+    """
+    layout = (TidyLayout if tidy else Layout)(tree, tree.blood_relatives(generations))
+    if workers is None:
+        layout.run()
+    else:
+        layout.run_branches(workers)
+    if untangle:
+        layout.untangle()
+    return layout.positions(person_width)
@@ -1,5 +1,10 @@
+import sys
 import draw_tree
 from data.TCBL import family
 
-draw_tree.drawTree(family)
-
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    generations = int(args[0]) if args else 5
+    # --workers=N lays out each branch apart, on N processes
+    workers = next((int(a.split('=', 1)[1]) for a in sys.argv[1:] if a.startswith('--workers=')), None)
+    draw_tree.drawTree(family, generations, tidy='--tidy' in sys.argv, untangle='--untangle' in sys.argv, workers=workers)
@@ -0,0 +1,125 @@
+"""Where everyone in the viewer is, kept in NumPy arrays so whole rows can be moved at once"""
+from typing import Iterable, Mapping
+import numpy as np
+
+from family_tree import Person
+
+# space left between neighbours when a row is realigned
+GAP = 40
+
+
+def _packed(left: np.ndarray, width: np.ndarray) -> np.ndarray:
+    """Left edges for each row of a matrix of boxes, pushed apart until they're GAP apart
+
+    Rows are in order left to right and padded at the end with infinite
+    lefts. Where boxes overlap they're pushed out as far one way as the
+    other, so anyone with room around them stays where they are.
+    """
+    step = np.where(np.isinf(left), 0, width + GAP)
+    # how much has to fit to the left and right of each box
+    before = np.cumsum(step, axis=1) - step
+    after = step.sum(axis=1, keepdims=True) - before - step
+    # a running max keeps each box clear of everyone on their left, and a
+    # running min from the other end clear of everyone on their right
+    pushed_right = np.maximum.accumulate(left - before, axis=1) + before
+    pushed_left = np.minimum.accumulate((left + width + after)[:, ::-1], axis=1)[:, ::-1] - after - width
+    return (pushed_right + pushed_left) / 2
+
+
+def _tight(left: np.ndarray, width: np.ndarray) -> np.ndarray:
+    """Like _packed(), but every row squeezed together and centred on x = 0"""
+    step = np.where(np.isinf(left), 0, width + GAP)
+    before = np.cumsum(step, axis=1) - step
+    return before - (step.sum(axis=1, keepdims=True) - GAP) / 2
+
+
+class Positions:
+    """The centre, width and height of everyone, one slot each, grouped by generation row
+
+    Slots never move, so a node can hold views of its own centre and size
+    that stay in step with the arrays. Each row is an array of slots, left to
+    right as of the last realign().
+    """
+    def __init__(self, rows: Mapping[int, Iterable[Person]], centers: Mapping[Person, tuple[float, float]]):
+        self.people: list[Person] = []
+        self.gen: dict[Person, int] = {}
+        self.rows: dict[int, np.ndarray] = {}
+        for g in sorted(rows):
+            start = len(self.people)
+            for person in rows[g]:
+                self.people.append(person)
+                self.gen[person] = g
+            self.rows[g] = np.arange(start, len(self.people))
+        self.slot = {person: i for i, person in enumerate(self.people)}
+        self.xy = np.array([centers[person] for person in self.people], dtype=float).reshape(-1, 2)
+        self.size = np.zeros((len(self.people), 2), dtype=np.int64)
+        self.shown = np.ones(len(self.people), dtype=bool)
+
+        # parent and child slot of everyone with a parent here too
+        pairs = [
+            (self.slot[parent], i)
+            for i, person in enumerate(self.people)
+            for parent in person.parents
+            if parent in self.slot
+        ]
+        self._parents, self._children = np.array(pairs, dtype=np.int64).reshape(-1, 2).T
+
+    def hide(self, person: Person) -> None:
+        """Leave someone out of their row, their slot is kept"""
+        g = self.gen[person]
+        row = self.rows[g]
+        self.rows[g] = row[row != self.slot[person]]
+        self.shown[self.slot[person]] = False
+
+    def _matrix(self) -> tuple[list[int], np.ndarray, np.ndarray]:
+        """Every row's slots as a row of a matrix padded with -1, and where it isn't padding"""
+        gs = sorted(self.rows)
+        lengths = np.array([len(self.rows[g]) for g in gs], dtype=np.int64)
+        slots = np.full((len(gs), lengths.max(initial=0)), -1, dtype=np.int64)
+        filled = np.arange(slots.shape[1]) < lengths[:, None]
+        slots[filled] = np.concatenate([self.rows[g] for g in gs]) if gs else []
+        return gs, slots, filled
+
+    def realign(self, row_y: Mapping[int, float], spread: bool=False, center: bool=False) -> None:
+        """Sort each row by x, put it at its height and push apart anyone overlapping
+
+        All the rows are done at once. With `spread` each row is squeezed
+        together around the middle instead. With `center` anyone with children
+        shown is then moved over the middle of them, a row at a time from the
+        bottom up, and their row pushed apart again.
+        """
+        gs, slots, filled = self._matrix()
+        if not slots.size:
+            return
+        x = np.where(filled, self.xy[slots, 0], np.inf)
+        order = np.argsort(x, axis=1, kind='stable')
+        slots = np.take_along_axis(slots, order, axis=1)
+        x = np.take_along_axis(x, order, axis=1)
+        width = np.where(filled, self.size[slots, 0], 0)
+
+        left = (_tight if spread else _packed)(x - width/2, width)
+        self.xy[slots[filled], 0] = (left + width/2)[filled]
+        self.xy[slots[filled], 1] = np.repeat([row_y[g] for g in gs], filled.sum(axis=1))
+        for g, row, row_filled in zip(gs, slots, filled):
+            self.rows[g] = row[row_filled]
+
+        if center:
+            self._center(gs)
+
+    def _center(self, gs: list[int]) -> None:
+        shown = self.shown[self._parents] & self.shown[self._children]
+        parents, children = self._parents[shown], self._children[shown]
+        for g in sorted(gs):
+            row = self.rows[g]
+            if not len(row):
+                continue
+            # the middle of each parent's children, as they are after the rows below moved
+            total = np.bincount(parents, self.xy[children, 0], minlength=len(self.people))[row]
+            count = np.bincount(parents, minlength=len(self.people))[row]
+            x = np.where(count > 0, total / np.maximum(count, 1), self.xy[row, 0])
+
+            order = np.argsort(x, kind='stable')
+            row, x = row[order], x[order]
+            width = self.size[row, 0]
+            self.xy[row, 0] = _packed((x - width/2)[None], width[None])[0] + width/2
+            self.rows[g] = row
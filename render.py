@@ -0,0 +1,322 @@
+"""Draws laid out people onto a surface, with no window needed
+
+Only pygame's font module gets started, so charts can be made on machines
+without a display. Pictures too big to hold in memory are drawn and
+written out as PNG a strip of rows at a time.
+"""
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Collection, Iterable, Iterator, Mapping, TypeVar, Union
+import struct
+import zlib
+import pygame
+
+from family_tree import Tree, Person
+from layout import ROW_HEIGHT, layout_tree
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GRAY = (240, 240, 240)
+PERSON_COMPLETE = (200, 200, 200)
+PERSON_CHECK = (250, 250, 150)
+# a zoomed out subtree drawn as one box
+SUBTREE = (160, 160, 160)
+
+FONT_SIZE = 24
+BAND_HEIGHT = 40
+# rows drawn at once when writing a PNG, the strip is as wide as the picture
+STRIP_HEIGHT = 128
+PNG_LEVEL = 6
+# rendered labels kept around, lots of people share a name
+LABEL_CACHE_SIZE = 4096
+
+Color = tuple[int, int, int]
+
+_fonts: dict[int, pygame.font.Font] = {}
+_labels: OrderedDict[tuple[str, Color, int], pygame.Surface] = OrderedDict()
+# fonts can't render from more than one thread at a time, and the label
+# cache isn't safe to share either
+_font_lock = Lock()
+
+Point = tuple[float, float]
+# top, bottom, color, start, end, width
+Line = tuple[float, float, Color, Point, Point, int]
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def _forget_fonts() -> None:
+    # fonts, and labels drawn with them, can't be used once pygame has quit
+    _fonts.clear()
+    _labels.clear()
+
+
+def get_font(size: int=FONT_SIZE) -> pygame.font.Font:
+    """Get the default font, starting pygame's font module if it isn't"""
+    if not pygame.font.get_init():
+        _forget_fonts()
+        pygame.font.init()
+    if size not in _fonts:
+        if not _fonts:
+            # pygame.init() straight after pygame.quit() leaves the font
+            # module started but every old font freed, so catch the quit
+            pygame.register_quit(_forget_fonts)
+        _fonts[size] = pygame.font.Font(pygame.font.get_default_font(), size)
+    return _fonts[size]
+
+
+def person_color(person: Person) -> tuple[int, int, int]:
+    if person.name.endswith(' children'):
+        return PERSON_COMPLETE
+    elif not person.child_complete:
+        return PERSON_CHECK
+    elif person.double_check:
+        return PERSON_CHECK
+    else:
+        return PERSON_COMPLETE
+
+
+def label(text: str, color: Color=BLACK, size: int=FONT_SIZE) -> pygame.Surface:
+    """Rendered text, kept until it's one of the least recently used"""
+    key = (text, color, size)
+    surface = _labels.get(key)
+    if surface is not None:
+        _labels.move_to_end(key)
+        return surface
+
+    surface = get_font(size).render(text, True, color)
+    _labels[key] = surface
+    if len(_labels) > LABEL_CACHE_SIZE:
+        _labels.popitem(last=False)
+    return surface
+
+
+def node_size(person: Person, size: int=FONT_SIZE) -> tuple[int, int]:
+    """How big node_image() will be, without drawing it"""
+    return get_font(size).size(person.name)
+
+
+def node_image(person: Person, size: int=FONT_SIZE) -> pygame.Surface:
+    """A person's name on a box coloured by how complete they are"""
+    text = label(person.name, BLACK, size)
+    image = pygame.Surface(text.get_size())
+    image.fill(GRAY)
+    # the shadow shrinks with the text
+    shadow = max(1, round(5 * size / FONT_SIZE))
+    pygame.draw.rect(
+        image,
+        person_color(person),
+        (shadow, shadow, *image.get_size()),
+    )
+    image.blit(text, (0, 0))
+    return image
+
+
+def draw_bands(surface: pygame.Surface, offset: tuple[float, float], count: int, scale: float=1):
+    """Shade a band behind each generation's row"""
+    for i in range(count):
+        pygame.draw.rect(
+            surface,
+            GRAY,
+            (0, (i*ROW_HEIGHT+40)*scale+offset[1], surface.get_width(), max(1, BAND_HEIGHT*scale))
+        )
+
+
+def lines_from(person: Person, people: Collection[Person], centers: Mapping[Person, Point]) -> Iterator[tuple[Color, Point, Point, int]]:
+    """A black line from someone to their parent(s), and red ones to their spouses"""
+    allowed_parents = [p for p in person.parents if p in people]
+    if len(allowed_parents) == 1:
+        parent = allowed_parents[0]
+        yield BLACK, centers[person], centers[parent], 1
+    elif len(allowed_parents) == 2:
+        (x0, y0), (x1, y1) = centers[allowed_parents[0]], centers[allowed_parents[1]]
+        yield BLACK, centers[person], ((x0 + x1)/2, (y0 + y1)/2), 1
+
+    for spouse in person.spouses:
+        if spouse in people:
+            yield RED, centers[person], centers[spouse], 3
+
+
+def _lines(people: Collection[Person], centers: Mapping[Person, Point]) -> Iterator[tuple[Color, Point, Point, int]]:
+    for person in people:
+        yield from lines_from(person, people, centers)
+
+
+def draw_line(surface: pygame.Surface, color: Color, start: Point, end: Point, width: int=1):
+    """pygame.draw.line, but thick lines don't run on past an end that's off the surface"""
+    if width > 1:
+        clipped = surface.get_rect().inflate(2*width, 2*width).clipline(start, end)
+        if not clipped:
+            return
+        start, end = clipped
+    pygame.draw.line(surface, color, start, end, width)
+
+
+def draw_lines(surface: pygame.Surface, people: Collection[Person], centers: Mapping[Person, Point]):
+    for color, start, end, width in _lines(people, centers):
+        draw_line(surface, color, start, end, width)
+
+
+class Scene:
+    """Where everyone's box and lines go in a picture, so any strip of it can be drawn"""
+    def __init__(self, positions: dict[Person, Point], bands: int):
+        self.bands = bands
+
+        # boxes are measured, not drawn, until a strip needs them
+        rects: dict[Person, pygame.Rect] = {}
+        for person, pos in positions.items():
+            rect = pygame.Rect((0, 0), node_size(person))
+            rect.center = pos
+            rects[person] = rect
+        bounds = pygame.Rect(0, 0, 0, 0)
+        if rects:
+            bounds = pygame.Rect(next(iter(rects.values()))).unionall(list(rects.values()))
+        self.size: tuple[int, int] = bounds.size
+        self.offset = (-bounds.x, -bounds.y)
+        for rect in rects.values():
+            rect.move_ip(self.offset)
+
+        # both sorted by their top, so a strip only looks at what reaches into it
+        self.nodes = sorted(rects.items(), key=lambda item: item[1].top)
+        self._node_tops = [rect.top for _, rect in self.nodes]
+        self._node_span = max((rect.height for rect in rects.values()), default=0)
+
+        centers = {person: rect.center for person, rect in rects.items()}
+        self.lines: list[Line] = sorted((
+            # wide lines reach past their ends
+            (min(start[1], end[1]) - width, max(start[1], end[1]) + width, color, start, end, width)
+            for color, start, end, width in _lines(positions, centers)
+        ), key=lambda line: line[0])
+        self._line_tops = [line[0] for line in self.lines]
+        self._line_span = max((bottom - top for top, bottom, *_ in self.lines), default=0)
+
+    def draw(self, top: int, height: int) -> pygame.Surface:
+        """Draw the rows from `top` down, `height` rows tall"""
+        bottom = top + height
+        # pygame loses the first row of a line clipped at the top edge, so
+        # draw a row higher than asked and leave that one off
+        whole = pygame.Surface((self.size[0], height + 1))
+        surface = whole.subsurface((0, 1, self.size[0], height))
+        top -= 1
+        whole.fill(WHITE)
+        draw_bands(whole, (self.offset[0], self.offset[1] - top), self.bands)
+
+        start = bisect_left(self._line_tops, top - self._line_span)
+        end = bisect_left(self._line_tops, bottom)
+        for line_top, line_bottom, color, (x0, y0), (x1, y1), width in self.lines[start:end]:
+            if line_bottom >= top:
+                draw_line(whole, color, (x0, y0 - top), (x1, y1 - top), width)
+
+        start = bisect_left(self._node_tops, top - self._node_span)
+        end = bisect_left(self._node_tops, bottom)
+        for person, rect in self.nodes[start:end]:
+            if rect.bottom > top:
+                with _font_lock:
+                    image = node_image(person)
+                whole.blit(image, rect.move(0, -top))
+        return surface
+
+
+def render(positions: dict[Person, Point], bands: int) -> pygame.Surface:
+    """Draw everyone at their position onto a surface just big enough to hold them"""
+    scene = Scene(positions, bands)
+    return scene.draw(0, scene.size[1])
+
+
+def render_tree(tree: Tree, generations: int) -> pygame.Surface:
+    """Lay out and draw the head's blood relatives"""
+    return render(layout_tree(tree, generations), generations+1)
+
+
+def to_rgb(surface: pygame.Surface) -> bytes:
+    """The surface as raw RGB rows, top to bottom"""
+    return pygame.image.tobytes(surface, 'RGB')
+
+
+def _in_order(func: Callable[[T], R], items: Iterable[T], workers: int) -> Iterator[R]:
+    """Map over items on a pool of threads, keeping only a few results waiting at once"""
+    if not workers:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(workers) as pool:
+        waiting = deque()
+        for item in items:
+            waiting.append(pool.submit(func, item))
+            if len(waiting) > workers * 2:
+                yield waiting.popleft().result()
+        while waiting:
+            yield waiting.popleft().result()
+
+
+def _png_chunk(f, kind: bytes, data: bytes) -> None:
+    f.write(struct.pack('>I', len(data)) + kind)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+
+def _scanlines(surface: pygame.Surface) -> bytearray:
+    """A surface's rows as PNG scanlines, each starting with filter type 0"""
+    width, height = surface.get_size()
+    stride = width * 3
+    pixels = pygame.image.tobytes(surface, 'RGB')
+    rows = bytearray(height * (stride + 1))
+    for y in range(height):
+        rows[y*(stride+1)+1:(y+1)*(stride+1)] = pixels[y*stride:(y+1)*stride]
+    return rows
+
+
+def save_png(
+        positions: dict[Person, Point],
+        bands: int,
+        path: str,
+        strip_height: int=STRIP_HEIGHT,
+        workers: int=0,
+        progress: Union[None, Callable[[int, int], None]]=None,
+    ) -> None:
+    """Draw everyone to a PNG a strip at a time, so the whole picture is never in memory
+
+    With `workers` the strips are drawn and compressed on that many threads.
+    `progress` is called with the rows written so far and the total. pygame
+    clips lines before drawing them, so a line cut by a strip edge can land
+    a pixel away from where render() puts it.
+    """
+    scene = Scene(positions, bands)
+    width, height = scene.size
+    if not width or not height:
+        raise ValueError('nothing to draw')
+
+    def strip(top: int) -> tuple[bytearray, bytes]:
+        # each strip is its own piece of raw deflate, flushed to a byte
+        # boundary so they can be joined in one zlib stream
+        rows = _scanlines(scene.draw(top, min(strip_height, height - top)))
+        compressor = zlib.compressobj(PNG_LEVEL, zlib.DEFLATED, -15)
+        last = top + strip_height >= height
+        return rows, compressor.compress(rows) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        _png_chunk(f, b'IDAT', b'\x78\x9c')
+
+        checksum = 1
+        done = 0
+        for rows, data in _in_order(strip, range(0, height, strip_height), workers):
+            checksum = zlib.adler32(rows, checksum)
+            _png_chunk(f, b'IDAT', data)
+            done = min(done + strip_height, height)
+            if progress is not None:
+                progress(done, height)
+
+        _png_chunk(f, b'IDAT', struct.pack('>I', checksum))
+        _png_chunk(f, b'IEND', b'')
+
+
+def save(tree: Tree, path: str, generations: int) -> None:
+    """Draw the head's blood relatives to an image file, the type is picked from the extension"""
+    if path.lower().endswith('.png'):
+        save_png(layout_tree(tree, generations), generations+1, path)
+    else:
+        pygame.image.save(render_tree(tree, generations), path)
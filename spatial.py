@@ -0,0 +1,140 @@
+"""Uniform grids for finding what overlaps a rectangle without looking at everything"""
+from collections import defaultdict
+from typing import DefaultDict, Generic, Hashable, Iterator, TypeVar
+
+CELL_SIZE = 512
+# anything more than this many cells across goes in a coarser grid, with
+# cells LEVEL_SCALE times wider or taller, so long lines don't fill thousands of cells
+LEVEL_SPAN = 4
+LEVEL_SCALE = 8
+
+K = TypeVar('K', bound=Hashable)
+# how many times wider and taller the cells are than the finest ones
+Level = tuple[int, int]
+# level, then left, top, right, bottom cell in it
+Cells = tuple[Level, int, int, int, int]
+# left, top, width, height
+Box = tuple[float, float, float, float]
+
+
+class Grid(Generic[K]):
+    """Buckets keys by the grid cells their bounding box covers
+
+    Big boxes are kept in coarser grids stacked on the first, only coarser
+    the way they're big in, and checked against the box they were added
+    with when they're found.
+    """
+    def __init__(self, cell_size: int=CELL_SIZE):
+        self.cell_size = cell_size
+        # level -> cell -> keys
+        self._cells: DefaultDict[Level, dict[tuple[int, int], set[K]]] = defaultdict(dict)
+        self._covers: dict[K, Cells] = {}
+        # left, top, right, bottom of the keys in coarser levels
+        self._edges: dict[K, Box] = {}
+
+    def __len__(self) -> int:
+        return len(self._covers)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._covers
+
+    def _cover(self, box: Box, level: Level) -> Cells:
+        left, top, width, height = box
+        size_x = self.cell_size * LEVEL_SCALE ** level[0]
+        size_y = self.cell_size * LEVEL_SCALE ** level[1]
+        return (
+            level,
+            int(left // size_x), int(top // size_y),
+            int((left + width) // size_x), int((top + height) // size_y),
+        )
+
+    def _fit(self, box: Box) -> Cells:
+        """The cells of the first level the box is at most LEVEL_SPAN cells across in, both ways"""
+        left, top, width, height = box
+        level = [0, 0]
+        for axis, start, length in ((0, left, width), (1, top, height)):
+            size = self.cell_size
+            while (start + length) // size - start // size >= LEVEL_SPAN:
+                size *= LEVEL_SCALE
+                level[axis] += 1
+        return self._cover(box, (level[0], level[1]))
+
+    @staticmethod
+    def _edge(box: Box) -> Box:
+        left, top, width, height = box
+        return left, top, left + width, top + height
+
+    @staticmethod
+    def _each(cover: Cells) -> Iterator[tuple[int, int]]:
+        _, left, top, right, bottom = cover
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                yield x, y
+
+    def insert(self, key: K, box: Box) -> None:
+        """Add a key, or move it if it's already here"""
+        cover = self._fit(box)
+        old = self._covers.get(key)
+        if old == cover:
+            if cover[0] != (0, 0):
+                self._edges[key] = self._edge(box)
+            return
+        if old is not None:
+            self.remove(key)
+        self._covers[key] = cover
+        if cover[0] != (0, 0):
+            self._edges[key] = self._edge(box)
+        cells = self._cells[cover[0]]
+        for cell in self._each(cover):
+            keys = cells.get(cell)
+            if keys is None:
+                cells[cell] = {key}
+            else:
+                keys.add(key)
+
+    def remove(self, key: K) -> None:
+        cover = self._covers.pop(key, None)
+        if cover is None:
+            return
+        self._edges.pop(key, None)
+        cells = self._cells[cover[0]]
+        for cell in self._each(cover):
+            keys = cells[cell]
+            keys.discard(key)
+            if not keys:
+                del cells[cell]
+        if not cells:
+            del self._cells[cover[0]]
+
+    def query(self, box: Box) -> set[K]:
+        """Everything whose cells overlap the box, which may include some that are just nearby"""
+        found: set[K] = set()
+        for level in self._cells:
+            near = self._query(self._cover(box, level))
+            if level != (0, 0):
+                # these cells are big, so only keep what really overlaps
+                left, top, right, bottom = self._edge(box)
+                edges = self._edges
+                for key in near:
+                    x0, y0, x1, y1 = edges[key]
+                    if x0 <= right and left <= x1 and y0 <= bottom and top <= y1:
+                        found.add(key)
+            else:
+                found |= near
+        return found
+
+    def _query(self, cover: Cells) -> set[K]:
+        found: set[K] = set()
+        level, left, top, right, bottom = cover
+        cells = self._cells[level]
+        if (right - left + 1) * (bottom - top + 1) > len(cells):
+            # a big box has more cells than are filled, so look at the filled ones instead
+            for (x, y), keys in cells.items():
+                if left <= x <= right and top <= y <= bottom:
+                    found |= keys
+            return found
+        for cell in self._each(cover):
+            keys = cells.get(cell)
+            if keys:
+                found |= keys
+        return found
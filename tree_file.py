@@ -0,0 +1,272 @@
+"""Binary, memory mapped storage for family trees
+
+The file is a header followed by one column per field. People are sorted
+by id, so someone can be found with a binary search of the id column and
+only built into a Person when they're asked for.
+"""
+from array import array
+from bisect import bisect_left
+from datetime import date
+from typing import Callable, Iterator, Union
+import mmap
+import struct
+
+from family_tree import Tree, Person, Relation, Gender, Family
+
+MAGIC = b'BFTV'
+VERSION = 1
+NONE = 0xFFFFFFFF
+
+# person flags
+BLOOD = 1
+DOUBLE_CHECK = 2
+IGNORE = 4
+CHILD_COMPLETE = 8
+SPOUSE_COMPLETE = 16
+
+COLUMNS = (
+    # one per person, sorted by id
+    ('id', 'q'),
+    ('name', 'I'),
+    ('dob', 'I'),
+    ('dod', 'I'),
+    ('notes', 'I'),
+    ('gender', 'B'),
+    ('flags', 'B'),
+    ('child_complete', 'i'),
+    ('spouse_complete', 'i'),
+    # one per person plus one, where each person's sources and family start
+    ('sources_start', 'I'),
+    ('family_start', 'I'),
+    # sources, as string indexes
+    ('sources', 'I'),
+    # edges
+    ('relation', 'B'),
+    ('person_id', 'q'),
+    ('start', 'i'),
+    ('end', 'i'),
+    # string pool
+    ('string_start', 'Q'),
+    ('string_data', 'B'),
+)
+
+HEADER = struct.Struct('<4sIqI')
+SECTION = struct.Struct('<QQ')
+
+
+def _ordinal(value: Union[None, bool, date]) -> int:
+    if isinstance(value, date):
+        return value.toordinal()
+    return 0
+
+
+def _date(ordinal: int) -> Union[None, date]:
+    if ordinal:
+        return date.fromordinal(ordinal)
+    return None
+
+
+def save(tree: Tree, path: str) -> None:
+    """Write a tree to `path`"""
+    tree.materialize()
+
+    strings: dict[str, int] = {}
+    def string(value: Union[None, str]) -> int:
+        if value is None:
+            return NONE
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    columns = {name: array(fmt) for name, fmt in COLUMNS}
+    columns['sources_start'].append(0)
+    columns['family_start'].append(0)
+
+    for node in sorted(tree.tree, key=lambda p: p.id):
+        flags = (
+            BLOOD * bool(node.blood)
+            | DOUBLE_CHECK * bool(node.double_check)
+            | IGNORE * bool(node.ignore)
+            | CHILD_COMPLETE * (node.child_complete is True)
+            | SPOUSE_COMPLETE * (node.spouse_complete is True)
+        )
+        columns['id'].append(node.id)
+        columns['name'].append(string(node.name))
+        columns['dob'].append(string(node.dob))
+        columns['dod'].append(string(node.dod))
+        columns['notes'].append(string(node.notes))
+        columns['gender'].append(node.gender.value)
+        columns['flags'].append(flags)
+        columns['child_complete'].append(_ordinal(node.child_complete))
+        columns['spouse_complete'].append(_ordinal(node.spouse_complete))
+
+        columns['sources'].extend(string(s) for s in node.sources)
+        columns['sources_start'].append(len(columns['sources']))
+
+        for fam in node.family:
+            columns['relation'].append(fam.relation.value)
+            columns['person_id'].append(fam.person_id)
+            columns['start'].append(_ordinal(fam.start))
+            columns['end'].append(_ordinal(fam.end))
+        columns['family_start'].append(len(columns['relation']))
+
+    data = bytearray()
+    columns['string_start'].append(0)
+    for value in strings:
+        data += value.encode()
+        columns['string_start'].append(len(data))
+    columns['string_data'] = array('B', data)
+
+    head_id = -1 if tree.head is None else tree.head.id
+    offset = HEADER.size + SECTION.size * len(COLUMNS)
+    sections = []
+    for name, _ in COLUMNS:
+        # keep every column 8 byte aligned
+        offset += -offset % 8
+        size = len(columns[name]) * columns[name].itemsize
+        sections.append((offset, size))
+        offset += size
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, head_id, len(COLUMNS)))
+        for section in sections:
+            f.write(SECTION.pack(*section))
+        for (name, _), (offset, _) in zip(COLUMNS, sections):
+            f.write(bytes(offset - f.tell()))
+            columns[name].tofile(f)
+
+
+class _FileFamily(Family):
+    """A relation that only builds the other person when they're looked at"""
+    __slots__ = ('_file',)
+
+    @property
+    def person(self) -> Person:
+        person = Family.person.__get__(self)
+        if person is None and self._file is not None:
+            person = self._file.person(self.person_id)
+            Family.person.__set__(self, person)
+        return person
+
+    @person.setter
+    def person(self, person: Person) -> None:
+        Family.person.__set__(self, person)
+
+
+class TreeFile:
+    """A memory mapped tree file, building people as they're asked for"""
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, head_id, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a family tree file')
+        if version != VERSION or count != len(COLUMNS):
+            raise ValueError(f'{path} is version {version}, expected {VERSION}')
+        self.head_id: Union[None, int] = None if head_id == -1 else head_id
+
+        view = memoryview(self._map)
+        self._columns: dict[str, memoryview] = {}
+        for i, (name, fmt) in enumerate(COLUMNS):
+            offset, size = SECTION.unpack_from(self._map, HEADER.size + SECTION.size * i)
+            self._columns[name] = view[offset:offset+size].cast(fmt)
+
+        self._people: dict[int, Person] = {}
+        # called with each person the first time they're built
+        self.on_load: Union[None, Callable[[Person], None]] = None
+
+    def __len__(self) -> int:
+        return len(self._columns['id'])
+
+    def __contains__(self, id: int) -> bool:
+        return self.index(id) is not None
+
+    def ids(self) -> Iterator[int]:
+        return iter(self._columns['id'])
+
+    def index(self, id: int) -> Union[None, int]:
+        """Get the row of the person with this id"""
+        ids = self._columns['id']
+        i = bisect_left(ids, id)
+        if i < len(ids) and ids[i] == id:
+            return i
+        return None
+
+    def string(self, index: int) -> Union[None, str]:
+        if index == NONE:
+            return None
+        start = self._columns['string_start']
+        return bytes(self._columns['string_data'][start[index]:start[index+1]]).decode()
+
+    def person(self, id: int) -> Union[None, Person]:
+        """Get the person with this id, building them the first time"""
+        node = self._people.get(id)
+        if node is not None or not self._columns:
+            # once closed, only people already read in can be had
+            return node
+        i = self.index(id)
+        if i is None:
+            return None
+
+        c = self._columns
+        family = []
+        for e in range(c['family_start'][i], c['family_start'][i+1]):
+            fam = _FileFamily(
+                Relation(c['relation'][e]),
+                c['person_id'][e],
+                None,
+                _date(c['start'][e]),
+                _date(c['end'][e]),
+            )
+            fam._file = self
+            family.append(fam)
+
+        flags = c['flags'][i]
+        node = Person(
+            self.string(c['name'][i]),
+            blood=bool(flags & BLOOD),
+            sources=[
+                self.string(s)
+                for s in c['sources'][c['sources_start'][i]:c['sources_start'][i+1]]
+            ],
+            family=family,
+            dob=self.string(c['dob'][i]),
+            dod=self.string(c['dod'][i]),
+            gender=Gender(c['gender'][i]),
+            child_complete=_date(c['child_complete'][i]) or bool(flags & CHILD_COMPLETE),
+            spouse_complete=_date(c['spouse_complete'][i]) or bool(flags & SPOUSE_COMPLETE),
+            double_check=bool(flags & DOUBLE_CHECK),
+            ignore=bool(flags & IGNORE),
+            notes=self.string(c['notes'][i]),
+            id=id,
+            check_id=False,
+        )
+        self._people[id] = node
+        if self.on_load is not None:
+            self.on_load(node)
+        return node
+
+    def close(self) -> None:
+        # the columns have to be let go before the map can close
+        for column in self._columns.values():
+            column.release()
+        self._columns.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'TreeFile':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def load(path: str) -> Tree:
+    """Open a tree file, people are read from it as they're reached"""
+    source = TreeFile(path)
+    tree = Tree()
+    tree.attach(source)
+    if source.head_id is not None:
+        tree.set_head(tree.get(source.head_id))
+    return tree